@@ -8,23 +8,95 @@ class Settings(BaseSettings):
     # MongoDB
     MONGODB_URL: str = "mongodb://localhost:27017"
     DATABASE_NAME: str = "project83120"
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = 2000  # Fail fast instead of queueing forever
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 5000
+    # Username prefix search may read from secondaries this far behind (min 90)
+    MONGO_SEARCH_MAX_STALENESS_SECONDS: int = 90
     
     # JWT Authentication
     SECRET_KEY: str = "change-this-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7  # 7 days
+    TOKEN_CACHE_SIZE: int = 10000  # Verified tokens kept in memory (0 = off)
+    TOKEN_CACHE_TTL_SECONDS: int = 300  # Re-verify at least this often
     
     # Email encryption (server-side only)
     EMAIL_ENCRYPTION_KEY: str = "32-byte-key-for-email-encryption!"
+    EMAIL_INDEX_KEY: str = ""  # HMAC key for email lookup (defaults to derived)
     
+    # Password hashing (Argon2 on a process pool)
+    PASSWORD_HASH_WORKERS: int = 0  # 0 = one per CPU core
+    PASSWORD_HASH_QUEUE_SIZE: int = 64  # Jobs waiting beyond this get 503
+    PASSWORD_HASH_RETRY_AFTER_SECONDS: int = 2
+
+    # Outgoing email (password reset OTPs). Empty SMTP_HOST = don't send,
+    # print OTPs to the console instead (development)
+    SMTP_HOST: str = ""
+    SMTP_PORT: int = 587
+    SMTP_USERNAME: str = ""  # Empty = no AUTH
+    SMTP_PASSWORD: str = ""
+    SMTP_STARTTLS: bool = True  # Upgrade plain connections with STARTTLS
+    SMTP_SSL: bool = False  # Implicit TLS (usually port 465) instead
+    SMTP_FROM: str = "Handshaker <no-reply@localhost>"
+    SMTP_TIMEOUT_SECONDS: float = 10
+    EMAIL_OUTBOX_WORKERS: int = 2  # Delivery tasks (and pooled SMTP connections) per process
+    EMAIL_OUTBOX_BATCH_SIZE: int = 50  # Emails claimed and sent per round
+    EMAIL_OUTBOX_POLL_SECONDS: float = 2  # Idle workers look for due jobs this often
+    EMAIL_OUTBOX_LEASE_SECONDS: int = 120  # Renewed while sending; lapses (retry) if a worker dies
+    EMAIL_OUTBOX_MAX_ATTEMPTS: int = 6
+    EMAIL_OUTBOX_RETRY_BASE_SECONDS: float = 5  # Backoff doubles per attempt...
+    EMAIL_OUTBOX_RETRY_MAX_SECONDS: float = 300  # ...up to this
+    EMAIL_OUTBOX_RETENTION_SECONDS: int = 86400  # Jobs (incl. failed) expire after this
+
     # STUN/TURN - easily replaceable
     STUN_SERVERS: str = "stun:stun.l.google.com:19302,stun:stun1.l.google.com:19302"
     TURN_SERVERS: str = ""
     TURN_USERNAME: str = ""
     TURN_CREDENTIAL: str = ""
     
+    # Rate limiting (in-memory token buckets, per worker)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_AUTH_PER_MINUTE: int = 10  # login/register per client IP
+    RATE_LIMIT_AUTH_BURST: int = 5
+    RATE_LIMIT_PASSWORD_RESET_PER_MINUTE: int = 3  # forgot/reset password per client IP
+    RATE_LIMIT_PASSWORD_RESET_BURST: int = 3
+    RATE_LIMIT_SIGNAL_PER_MINUTE: int = 1200  # Signals sent per user
+    RATE_LIMIT_SIGNAL_BURST: int = 200  # Must cover a full /signaling/send-batch
+    RATE_LIMIT_SHARDS: int = 16
+    RATE_LIMIT_IDLE_SECONDS: int = 600  # Forget buckets unused this long
+    RATE_LIMIT_MAX_KEYS: int = 100000  # Per route class; beyond, a shard's new keys share a bucket
+    RATE_LIMIT_IPV6_PREFIX: int = 64  # IPv6 clients are limited per prefix, not per address
+    RATE_LIMIT_TRUST_FORWARDED_FOR: bool = False  # Only behind a reverse proxy
+
+    # Metrics
+    METRICS_LOOP_LAG_INTERVAL_SECONDS: float = 0.5  # Event-loop lag probe period
+
+    # Presence
+    PRESENCE_TTL_SECONDS: int = 90  # Offline after this long without heartbeat
+    PRESENCE_FLUSH_SECONDS: float = 5  # Write-behind interval for is_online/last_seen
+
+    # Connection graph cache (authorizes signaling without a query per signal)
+    CONNECTION_CACHE_SIZE: int = 100000  # Users whose peer sets are cached
+    CONNECTION_CACHE_TTL_SECONDS: int = 60  # Backstop; changes are pushed over SIGNAL_BUS
+    CONNECTION_CACHE_MISS_RELOAD_SECONDS: int = 5  # Min gap between reloads on miss
+
     # Signaling
     SIGNAL_EXPIRE_SECONDS: int = 60  # Auto-delete signals after 60s
+    SIGNAL_REQUIRE_CONNECTION: bool = True  # Only relay between connected users
+    SIGNAL_LONG_POLL_MAX_SECONDS: int = 30  # Upper bound for /signaling/poll?wait=
+    SIGNAL_POLL_BATCH_SIZE: int = 100  # Max signals per poll (has_more beyond)
+    SIGNAL_LEASE_SECONDS: int = 30  # Unacked leased batch is redelivered after this
+    # Cross-worker fan-out: "memory" (single worker) or "mongo" (change
+    # streams on the signaling collection - needs a replica set)
+    SIGNAL_BUS: str = "memory"
+    # Undelivered signals: "mongo" (shared, survives restarts) or "memory"
+    # (single-node in-process broker, zero database I/O)
+    SIGNAL_STORE: str = "mongo"
+    SIGNAL_MEMORY_QUEUE_SIZE: int = 256  # Per-recipient cap for memory store
+    HANDSHAKE_SESSION_TTL_SECONDS: int = 300  # Unfinished handshake sessions expire
+    HANDSHAKE_SESSION_RETENTION_SECONDS: int = 60  # Finished ones stay readable this long
     
     @property
     def stun_list(self) -> List[str]:
@@ -0,0 +1,57 @@
+"""
+Index Registry
+Every index the services rely on, declared per collection.
+Applied idempotently on startup; checked by tests/test_query_plans.py.
+"""
+
+from typing import Dict, List
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import IndexModel
+
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("username", 1)], unique=True),
+        # Sparse: users registered before the blind index have no value yet
+        IndexModel([("email_index", 1)], unique=True, sparse=True),
+    ],
+    "connection_requests": [
+        # Lookups by either side of the request, keyset-paged in
+        # (created_at, _id) order
+        IndexModel([("from_user", 1), ("status", 1), ("created_at", 1), ("_id", 1)]),
+        IndexModel([("to_user", 1), ("status", 1), ("created_at", 1), ("_id", 1)]),
+        # One pending/accepted request per pair (declined ones drop pair_key)
+        IndexModel([("pair_key", 1)], unique=True, sparse=True),
+    ],
+    "signaling": [
+        # TTL index for auto-expiring signals
+        IndexModel([("expires_at", 1)], expireAfterSeconds=0),
+        # Backs poll (equality on to_user, ordered by created_at, then _id -
+        # a batch shares one created_at) and superseding a pair's signals
+        # (to_user + from_user filter)
+        IndexModel([("to_user", 1), ("created_at", 1), ("_id", 1)]),
+        # clear_signals also removes what the user sent
+        IndexModel([("from_user", 1)]),
+        # Per-session poll and purge (only session-tagged signals)
+        IndexModel([("session_id", 1), ("created_at", 1), ("_id", 1)], sparse=True),
+    ],
+    "handshake_sessions": [
+        # Looked up by _id; TTL removes expired / finished sessions
+        IndexModel([("expires_at", 1)], expireAfterSeconds=0),
+    ],
+    "connection_events": [
+        # Signal bus invalidations - only needed until change streams deliver them
+        IndexModel([("expires_at", 1)], expireAfterSeconds=0),
+    ],
+    "email_outbox": [
+        # Workers claim due pending jobs, oldest due first
+        IndexModel([("status", 1), ("next_attempt_at", 1)]),
+        # TTL: undeliverable jobs stop being retried and are removed
+        IndexModel([("expires_at", 1)], expireAfterSeconds=0),
+    ],
+}
+
+
+async def ensure_indexes(database: AsyncIOMotorDatabase):
+    """Create all registered indexes (no-op for ones that already exist)"""
+    for collection, indexes in INDEXES.items():
+        await database[collection].create_indexes(indexes)
@@ -1,5 +1,15 @@
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from typing import Optional, Sequence
+from motor.motor_asyncio import (
+    AsyncIOMotorClient,
+    AsyncIOMotorCollection,
+    AsyncIOMotorDatabase,
+)
+from pymongo import ReadPreference
+from pymongo.read_preferences import SecondaryPreferred
+from pymongo.write_concern import WriteConcern
 from app.config import settings
+from app.db.indexes import ensure_indexes
+from app.db.monitoring import command_timer, pool_monitor
 
 
 class MongoDB:
@@ -7,24 +17,59 @@ class MongoDB:
 
     client: AsyncIOMotorClient = None
     db: AsyncIOMotorDatabase = None
+    profiles: dict = {}
 
 
 db = MongoDB()
 
 
-async def connect_db():
-    """Initialize database connection and indexes"""
-    db.client = AsyncIOMotorClient(settings.MONGODB_URL)
-    db.db = db.client[settings.DATABASE_NAME]
+def _build_profiles() -> dict:
+    """
+    Named per-operation settings, applied on top of the database default
+    (majority writes, primary reads):
+    - ephemeral: signals and presence - fast w=1, loss on failover is fine
+    - search: username prefix search - secondaries within bounded staleness.
+      Key lookups stay on the primary: a stale key breaks key exchange.
+    """
+    return {
+        "ephemeral": {"write_concern": WriteConcern(w=1)},
+        "search": {
+            "read_preference": SecondaryPreferred(
+                max_staleness=settings.MONGO_SEARCH_MAX_STALENESS_SECONDS
+            )
+        },
+    }
 
-    # Create indexes
-    await db.db.users.create_index("username", unique=True)
 
-    # TTL index for auto-expiring signals
-    await db.db.signaling.create_index("expires_at", expireAfterSeconds=0)
-    await db.db.signaling.create_index("to_user")
+async def connect_db(database_name: Optional[str] = None, event_listeners: Sequence = ()):
+    """
+    Initialize database connection and indexes.
+    database_name / event_listeners override the configured database and
+    add PyMongo listeners (the query plan test records queries this way).
+    """
+    database_name = database_name or settings.DATABASE_NAME
+    db.client = AsyncIOMotorClient(
+        settings.MONGODB_URL,
+        maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+        waitQueueTimeoutMS=settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        # Listeners run on Motor's executor threads, not the event loop -
+        # they (and the metrics they feed) guard their state with locks
+        event_listeners=[pool_monitor, command_timer, *event_listeners],
+    )
+    # Durable default - user accounts and connections
+    db.db = db.client.get_database(
+        database_name,
+        write_concern=WriteConcern(w="majority"),
+        read_preference=ReadPreference.PRIMARY,
+    )
+    db.profiles = _build_profiles()
 
-    print(f"Connected to MongoDB: {settings.DATABASE_NAME}")
+    # Create indexes (declared in app/db/indexes.py)
+    await ensure_indexes(db.db)
+
+    print(f"Connected to MongoDB: {database_name}")
 
 
 async def close_db():
@@ -37,3 +82,8 @@ async def close_db():
 def get_database() -> AsyncIOMotorDatabase:
     """Get database instance"""
     return db.db
+
+
+def get_collection(name: str, profile: str) -> AsyncIOMotorCollection:
+    """Get collection with a named write concern / read routing profile"""
+    return db.db.get_collection(name, **db.profiles[profile])
@@ -0,0 +1,110 @@
+"""
+MongoDB Monitoring
+PyMongo event listeners feeding internal stats and /metrics
+"""
+
+import threading
+import time
+from pymongo import monitoring
+from app.utils.metrics import registry
+
+mongo_command_duration = registry.histogram(
+    "mongo_command_duration_seconds",
+    "MongoDB command round trip by command name",
+    ("command",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+mongo_command_failures = registry.counter(
+    "mongo_command_failures_total", "Failed MongoDB commands by command name", ("command",)
+)
+
+
+class PoolCheckoutMonitor(monitoring.ConnectionPoolListener):
+    """
+    Measures how long operations wait to check a connection out of the
+    pool (start time kept per thread).
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.failures = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def _finish(self, failed: bool):
+        started = getattr(self._local, "started", None)
+        if started is None:
+            return
+        self._local.started = None
+        wait = time.perf_counter() - started
+        with self._lock:
+            if failed:
+                self.failures += 1
+            else:
+                self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def connection_checked_out(self, event):
+        self._finish(failed=False)
+
+    def connection_check_out_failed(self, event):
+        self._finish(failed=True)
+
+    # Remaining pool events are not needed
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.checkouts + self.failures
+            return {
+                "checkouts": self.checkouts,
+                "failures": self.failures,
+                "wait_avg_ms": round(self.wait_total / (total or 1) * 1000, 3),
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Records every command's server-reported duration"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        mongo_command_duration.observe(event.duration_micros / 1e6, command=event.command_name)
+
+    def failed(self, event):
+        mongo_command_duration.observe(event.duration_micros / 1e6, command=event.command_name)
+        mongo_command_failures.inc(command=event.command_name)
+
+
+pool_monitor = PoolCheckoutMonitor()
+command_timer = CommandTimer()
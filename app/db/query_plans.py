@@ -0,0 +1,106 @@
+"""
+Query Plan Check
+Records the filters the services actually send (a PyMongo command
+listener) and explains each of them against a real mongod, flagging
+any that would scan a whole collection.
+Driven by tests/test_query_plans.py.
+"""
+
+import threading
+from typing import Iterator, List, NamedTuple, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import monitoring
+from app.db.indexes import INDEXES
+
+
+class RecordedQuery(NamedTuple):
+    command: str
+    collection: str
+    filter: dict
+    sort: Optional[dict]
+
+
+def _queries(name: str, command: dict) -> Iterator[RecordedQuery]:
+    """The filter (and sort) of each statement in a read/write command"""
+    if name == "find":
+        yield RecordedQuery(name, command[name], command.get("filter", {}), command.get("sort"))
+    elif name in ("update", "delete"):
+        statements = command.get("updates" if name == "update" else "deletes", [])
+        for statement in statements:
+            yield RecordedQuery(name, command[name], statement.get("q", {}), None)
+    elif name == "findAndModify":
+        yield RecordedQuery(name, command[name], command.get("query", {}), command.get("sort"))
+    elif name in ("count", "distinct"):
+        yield RecordedQuery(name, command[name], command.get("query", {}), None)
+    elif name == "aggregate":
+        # count_documents and friends - the leading $match picks the index
+        pipeline = command.get("pipeline", [])
+        if pipeline and "$match" in pipeline[0]:
+            yield RecordedQuery(name, command[name], pipeline[0]["$match"], None)
+
+
+class QueryRecorder(monitoring.CommandListener):
+    """Keeps every query sent to one database"""
+
+    def __init__(self, database_name: str):
+        self.database_name = database_name
+        self.queries: List[RecordedQuery] = []
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        if event.database_name != self.database_name:
+            return
+        queries = list(_queries(event.command_name, event.command))
+        with self._lock:
+            self.queries.extend(queries)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def _stages(plan: dict):
+    """Walk a plan tree, yielding every stage name"""
+    yield plan.get("stage")
+    if "inputStage" in plan:
+        yield from _stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        yield from _stages(child)
+    if "queryPlan" in plan:
+        yield from _stages(plan["queryPlan"])
+
+
+async def explain_winning_stages(
+    database: AsyncIOMotorDatabase, query: RecordedQuery
+) -> List[str]:
+    """Stages of the winning plan for the query's filter and sort"""
+    command = {"find": query.collection, "filter": query.filter}
+    if query.sort:
+        command["sort"] = query.sort
+    result = await database.command("explain", command, verbosity="queryPlanner")
+    return list(_stages(result["queryPlanner"]["winningPlan"]))
+
+
+async def check_query_plans(
+    database: AsyncIOMotorDatabase, queries: List[RecordedQuery]
+) -> List[str]:
+    """
+    Failure message per distinct query that does a COLLSCAN, or that
+    targets a collection without declared indexes (an explain there
+    would show nothing useful).
+    """
+    failures = {}
+    for query in queries:
+        label = f"{query.command} {query.collection} {query.filter!r}"
+        if query.sort:
+            label += f" sort {dict(query.sort)!r}"
+        if query.collection not in INDEXES:
+            failures.setdefault(label, f"{label}: no indexes declared for {query.collection}")
+            continue
+        stages = await explain_winning_stages(database, query)
+        if "COLLSCAN" in stages:
+            plan = " <- ".join(filter(None, stages))
+            failures.setdefault(label, f"{label}: COLLSCAN ({plan})")
+    return list(failures.values())
@@ -1,15 +1,35 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
 from app.db.mongodb import connect_db, close_db
 from app.routes import auth, users, signaling, connection
+from app.services import signaling_service
+from app.services.presence_service import presence
+from app.services.email_outbox import email_outbox
+from app.utils.password_pool import password_pool
+from app.utils.security import token_cache
+from app.services.connection_graph import connection_graph
+from app.db.monitoring import pool_monitor
+from app.utils.metrics import MetricsMiddleware, loop_lag, registry
+from app.utils.rate_limit import rate_limiters
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Startup and shutdown events"""
     await connect_db()
+    await signaling_service.start()
+    password_pool.start()
+    await presence.start()
+    email_outbox.start()
+    loop_lag.start()
     yield
+    await loop_lag.stop()
+    await email_outbox.stop()
+    await presence.stop()
+    password_pool.stop()
+    await signaling_service.stop()
     await close_db()
 
 
@@ -40,13 +60,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Non-safelisted response headers browser clients need to read
+    expose_headers=["X-Next-Cursor", "ETag", "Retry-After"],
 )
 
 # Include routers
-app.include_router(auth.router)
-app.include_router(users.router)
-app.include_router(connection.router)
-app.include_router(signaling.router)
+ROUTERS = [auth.router, users.router, connection.router, signaling.router]
+for router in ROUTERS:
+    app.include_router(router)
+
+# Request timing per router (/auth -> auth, ...)
+app.add_middleware(
+    MetricsMiddleware, routers={router.prefix: router.prefix.strip("/") for router in ROUTERS}
+)
+
+# /health/stats counters are exported on /metrics too
+registry.add_stats("password_hashing", password_pool.stats)
+registry.add_stats("token_cache", token_cache.stats)
+registry.add_stats("connection_graph", connection_graph.stats)
+registry.add_stats("mongo_pool", pool_monitor.stats)
+registry.add_stats("email_outbox", email_outbox.stats)
+for route_class, limiter in rate_limiters.items():
+    registry.add_stats(f"rate_limit_{route_class}", limiter.stats)
 
 
 @app.get("/health", tags=["Health"])
@@ -55,6 +90,25 @@ async def health():
     return {"status": "ok", "service": "handshaker"}
 
 
+@app.get("/health/stats", tags=["Health"])
+async def health_stats():
+    """Internal performance counters"""
+    return {
+        "password_hashing": password_pool.stats(),
+        "token_cache": token_cache.stats(),
+        "connection_graph": connection_graph.stats(),
+        "mongo_pool": pool_monitor.stats(),
+        "email_outbox": email_outbox.stats(),
+        "rate_limits": {name: limiter.stats() for name, limiter in rate_limiters.items()},
+    }
+
+
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus text format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/", tags=["Health"])
 async def root():
     """Root endpoint"""
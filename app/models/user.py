@@ -8,6 +8,7 @@ class UserInDB(BaseModel):
 
     username: str  # @unique_id format
     email_encrypted: str  # AES encrypted (server can't read)
+    email_index: str  # HMAC blind index for login by email
     birthday_encrypted: str  # AES encrypted (for key recovery)
     password_hash: str  # Argon2 hash
     pgp_public_key: str  # PGP public key (for encryption)
@@ -11,11 +11,14 @@ from app.schemas.auth import (
 )
 from app.services import auth_service
 from app.utils.security import get_current_user
+from app.utils.rate_limit import limit_by_ip
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
 
-@router.post("/register", response_model=TokenResponse)
+@router.post(
+    "/register", response_model=TokenResponse, dependencies=[Depends(limit_by_ip("auth"))]
+)
 async def register(req: RegisterRequest):
     """
     Register new user with PGP public key.
@@ -29,7 +32,9 @@ async def register(req: RegisterRequest):
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.post("/login", response_model=TokenResponse)
+@router.post(
+    "/login", response_model=TokenResponse, dependencies=[Depends(limit_by_ip("auth"))]
+)
 async def login(req: LoginRequest):
     """Authenticate and get JWT token"""
     try:
@@ -59,12 +64,16 @@ async def update_pgp_key(
     return {"message": "PGP key updated"}
 
 
-@router.post("/forgot-password", response_model=ForgotPasswordResponse)
+@router.post(
+    "/forgot-password",
+    response_model=ForgotPasswordResponse,
+    dependencies=[Depends(limit_by_ip("password_reset"))],
+)
 async def forgot_password(req: ForgotPasswordRequest):
     """
     Request password reset.
-    - Generates OTP and sends to registered email
-    - For DEBUG: OTP is printed to server console
+    - Generates OTP and queues it for the registered email
+    - For DEBUG (no SMTP_HOST): OTP is printed to server console
     - Returns email hint for verification
     """
     try:
@@ -73,7 +82,7 @@ async def forgot_password(req: ForgotPasswordRequest):
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@router.post("/reset-password")
+@router.post("/reset-password", dependencies=[Depends(limit_by_ip("password_reset"))])
 async def reset_password(req: ResetPasswordRequest):
     """
     Reset password with OTP.
@@ -3,7 +3,8 @@ Connection Routes
 API endpoints for connection requests
 """
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from typing import Literal, Optional
 from app.schemas.connection import ConnectionRequestCreate, ConnectionRequestAction
 from app.services.connection_service import (
     send_connection_request,
@@ -13,6 +14,7 @@ from app.services.connection_service import (
     remove_connection,
 )
 from app.utils.security import get_current_user
+from app.utils.http_cache import conditional_json
 
 router = APIRouter(prefix="/connections", tags=["Connections"])
 
@@ -30,9 +32,22 @@ async def create_request(
 
 
 @router.get("/pending")
-async def get_pending(current_user: str = Depends(get_current_user)):
-    """Get all pending incoming connection requests"""
-    return await get_pending_requests(current_user)
+async def get_pending(
+    request: Request,
+    limit: int = Query(50, ge=1, le=200),
+    after: Optional[str] = Query(None, description="Cursor from X-Next-Cursor"),
+    current_user: str = Depends(get_current_user),
+):
+    """
+    Get pending incoming connection requests, oldest first.
+    When more follow, X-Next-Cursor holds the value for ?after=.
+    """
+    try:
+        requests, next_cursor = await get_pending_requests(current_user, limit, after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return conditional_json(request, requests, headers)
 
 
 @router.post("/respond")
@@ -48,9 +63,27 @@ async def respond(
 
 
 @router.get("/list")
-async def list_connections(current_user: str = Depends(get_current_user)):
-    """Get all accepted connections"""
-    return await get_connections(current_user)
+async def list_connections(
+    request: Request,
+    limit: int = Query(100, ge=1, le=500),
+    after: Optional[str] = Query(None, description="Cursor from X-Next-Cursor"),
+    fields: Literal["all", "fingerprint"] = Query("all", description="fingerprint = omit keys"),
+    current_user: str = Depends(get_current_user),
+):
+    """
+    Get accepted connections, oldest first.
+    When more follow, X-Next-Cursor holds the value for ?after=.
+    Supports If-None-Match (ETag) and ?fields=fingerprint.
+    """
+    try:
+        connections, next_cursor = await get_connections(current_user, limit, after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if fields == "fingerprint":
+        for conn in connections:
+            conn.pop("pgp_public_key", None)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return conditional_json(request, connections, headers)
 
 
 @router.delete("/{username}")
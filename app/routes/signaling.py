@@ -1,40 +1,221 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket
+from fastapi import WebSocketDisconnect, status
+from pydantic import ValidationError
+from typing import Optional
 from app.schemas.signaling import (
     SignalSendRequest,
+    SignalBatchSendRequest,
     SignalPollResponse,
     ICEServersResponse,
+    HandshakeSessionCreate,
+    HandshakeSessionStateUpdate,
+    HandshakeSessionInfo,
 )
-from app.services import signaling_service
-from app.utils.security import get_current_user
+from app.services import signaling_service, handshake_service
+from app.services.websocket_manager import manager
+from app.services.presence_service import presence
+from app.utils.security import get_current_user, decode_token
+from app.utils.rate_limit import limit_by_user, rate_limiters
+from app.utils import wire
 from app.config import settings
 
 router = APIRouter(prefix="/signaling", tags=["Signaling"])
 
 
-@router.post("/send")
+@router.post(
+    "/send",
+    dependencies=[Depends(limit_by_user("signal"))],
+    openapi_extra=wire.openapi_body(SignalSendRequest),
+)
 async def send_signal(
-    req: SignalSendRequest, current_user: str = Depends(get_current_user)
+    req: SignalSendRequest = Depends(wire.body(SignalSendRequest)),
+    current_user: str = Depends(get_current_user),
 ):
     """
     Send signaling message (offer/answer/ICE) to another user.
 
     The encrypted_payload is PGP-encrypted by the client.
     Server CANNOT read it - just relays to recipient.
+    Body: JSON, or SignalSendRequest as application/msgpack or
+    application/cbor with encrypted_payload as raw bytes.
+
+    An offer returns a new negotiation generation. Send it back as
+    `generation` with the matching answer/ICE. Nothing is deleted on
+    send; polls skip whatever you queued for an older generation
+    (untagged signals count by send time), e.g. after an ICE restart.
+    """
+    try:
+        generation = await signaling_service.send_signal(current_user, req)
+    except ValueError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    if generation is None:
+        return {"message": "Signal sent"}
+    return {"message": "Signal sent", "generation": generation}
+
+
+@router.post("/send-batch", openapi_extra=wire.openapi_body(SignalBatchSendRequest))
+async def send_signal_batch(
+    req: SignalBatchSendRequest = Depends(wire.body(SignalBatchSendRequest)),
+    current_user: str = Depends(get_current_user),
+):
+    """
+    Send up to 100 signals in one request, possibly to several users.
+    Meant for trickle-ICE bursts - one auth check and one bulk write.
+    Each signal counts against the sender's rate limit.
+    Accepts the same body formats as /send.
     """
-    await signaling_service.send_signal(current_user, req)
-    return {"message": "Signal sent"}
+    rate_limiters["signal"].check(current_user, len(req.signals))
+    try:
+        generations = await signaling_service.send_signals(current_user, req.signals)
+    except ValueError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    return {"message": "Signals sent", "count": len(generations), "generations": generations}
 
 
-@router.get("/poll", response_model=SignalPollResponse)
-async def poll_signals(current_user: str = Depends(get_current_user)):
+@router.get("/poll", response_model=SignalPollResponse, response_model_exclude_none=True)
+async def poll_signals(
+    request: Request,
+    wait: int = Query(
+        0,
+        ge=0,
+        le=settings.SIGNAL_LONG_POLL_MAX_SECONDS,
+        description="Long-poll: seconds to wait for a signal if none pending",
+    ),
+    ack: Optional[str] = Query(
+        None, description="Cursor of a leased batch to acknowledge (delete)"
+    ),
+    lease: bool = Query(
+        False, description="Lease the batch instead of deleting it; ack via cursor"
+    ),
+    coalesce: bool = Query(
+        False, description="One ICE message per sender, encrypted_payload as a list"
+    ),
+    session_id: Optional[str] = Query(
+        None, description="Only signals of this handshake session"
+    ),
+    current_user: str = Depends(get_current_user),
+):
     """
     Poll for pending signaling messages.
 
     Returns PGP-encrypted payloads that only the client can decrypt.
-    Messages are deleted after fetching.
+    Messages are deleted after fetching, unless ?lease=true - then they
+    are redelivered until acknowledged with ?ack=<cursor>.
+    Keep polling while has_more is true.
+    Use ?wait=25 for long-polling when WebSocket is not available.
+    Polling also counts as a presence heartbeat.
+    Send Accept: application/msgpack or application/cbor for a binary
+    response (raw payload bytes, epoch-ms timestamps).
+    """
+    presence.heartbeat(current_user)
+    codec = wire.response_codec(request)
+    result = await signaling_service.poll_signals(
+        current_user,
+        wait=wait,
+        ack=ack,
+        lease=lease,
+        binary=codec is not None,
+        coalesce=coalesce,
+        session_id=session_id,
+    )
+    if codec is not None:
+        return wire.encode(codec, result)
+    return result
+
+
+@router.websocket("/ws")
+async def signaling_ws(websocket: WebSocket, token: str = Query(...)):
+    """
+    Signaling over WebSocket (replaces polling).
+
+    - Authenticate with ?token=<JWT> (browsers can't set headers on WS)
+    - Server pushes offer/answer/ICE frames as they arrive
+    - Client may send frames shaped like SignalSendRequest (JSON);
+      invalid frames get an {"error": ...} frame back
+    """
+    try:
+        username = decode_token(token).get("sub")
+    except HTTPException:
+        username = None
+    if not username:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    # Register before draining so nothing lands in the gap; pushes are
+    # held back until the backlog is out
+    await manager.connect(username, websocket)
+    presence.heartbeat(username)
+    try:
+        # Leased batches, each acked by the next poll once it was sent -
+        # a socket dying mid-batch leaves the rest for redelivery
+        cursor, has_more = None, True
+        while has_more:
+            backlog = await signaling_service.poll_signals(username, ack=cursor, lease=True)
+            for message in backlog.messages:
+                await websocket.send_json(message.model_dump(exclude_none=True))
+            cursor, has_more = backlog.cursor, backlog.has_more
+        if cursor:
+            await signaling_service.ack_signals(username, cursor)
+        await manager.flush(websocket)
+
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                break
+            try:
+                # Malformed JSON is a ValidationError too - answered, not fatal
+                req = SignalSendRequest.model_validate_json(
+                    frame.get("text") or frame.get("bytes") or b""
+                )
+                rate_limiters["signal"].check(username)
+                await signaling_service.send_signal(username, req)
+            except (ValidationError, ValueError) as e:
+                await websocket.send_json({"error": str(e)})
+            except HTTPException as e:
+                await websocket.send_json({"error": e.detail})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(username, websocket)
+
+
+@router.post("/sessions", response_model=HandshakeSessionInfo)
+async def create_session(
+    req: HandshakeSessionCreate, current_user: str = Depends(get_current_user)
+):
+    """
+    Start a handshake session with a connected user.
+    Tag its signals with session_id; offers/answers advance its state.
+    """
+    try:
+        return await handshake_service.create_session(current_user, req.peer)
+    except ValueError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+
+@router.get("/sessions/{session_id}", response_model=HandshakeSessionInfo)
+async def get_session(session_id: str, current_user: str = Depends(get_current_user)):
+    """Current state of a handshake session"""
+    try:
+        return await handshake_service.get_session(current_user, session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post("/sessions/{session_id}/state", response_model=HandshakeSessionInfo)
+async def finish_session(
+    session_id: str,
+    req: HandshakeSessionStateUpdate,
+    current_user: str = Depends(get_current_user),
+):
+    """
+    Mark a handshake connected or failed.
+    Its signals still queued for either side are deleted right away.
     """
-    messages = await signaling_service.poll_signals(current_user)
-    return SignalPollResponse(messages=messages)
+    try:
+        return await handshake_service.finish_session(current_user, session_id, req.state)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
 
 
 @router.delete("/clear")
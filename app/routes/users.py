@@ -1,40 +1,96 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
-from app.schemas.auth import UserPublicInfo
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from app.schemas.auth import (
+    UserPublicInfo,
+    BatchUserLookupRequest,
+    BatchUserLookupResponse,
+    PresenceRequest,
+)
 from app.services import auth_service
+from app.services.presence_service import presence
 from app.utils.security import get_current_user
-from typing import List
+from app.utils.http_cache import conditional_json
+from typing import Dict, List, Literal, Optional
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
 
 @router.get("/search", response_model=List[UserPublicInfo])
 async def search_users(
+    request: Request,
     q: str = Query(..., min_length=1, description="Search query (username prefix)"),
+    limit: int = Query(20, ge=1, le=100),
+    after: Optional[str] = Query(None, description="Cursor from X-Next-Cursor"),
+    fields: Literal["all", "fingerprint"] = Query("all", description="fingerprint = omit keys"),
     current_user: str = Depends(get_current_user),
 ):
     """
     Search users by username.
-    Returns list of users with their PGP public keys.
-    """
-    users = await auth_service.search_users(q)
-    return [
-        UserPublicInfo(
-            username=u["username"],
-            pgp_public_key=u["pgp_public_key"],
-            is_online=u.get("is_online", False),
-        )
+    Returns list of users with their PGP public keys. Results may come
+    from a secondary (up to MONGO_SEARCH_MAX_STALENESS_SECONDS old) - fetch
+    /users/{username} for the key to use in a key exchange.
+    When more results may follow, X-Next-Cursor holds the value for ?after=.
+    Supports If-None-Match (ETag) and ?fields=fingerprint.
+    """
+    users = await auth_service.search_users(q, limit=limit, after=after)
+    headers = {}
+    if len(users) == limit:
+        headers["X-Next-Cursor"] = users[-1]["username"]
+    results = [
+        auth_service.to_public_info(u, include_key=fields == "all")
         for u in users
         if u["username"] != current_user  # Exclude self
     ]
+    return conditional_json(request, results, headers)
+
+
+@router.post("/batch", response_model=BatchUserLookupResponse)
+async def get_users_batch(
+    req: BatchUserLookupRequest,
+    fields: Literal["all", "fingerprint"] = Query("all", description="fingerprint = omit keys"),
+    current_user: str = Depends(get_current_user),
+):
+    """
+    Get public info for up to 500 users in one request.
+    Usernames are normalized like GET /users/{username}; unknown ones
+    are listed under missing.
+    """
+    return await auth_service.get_users_public_batch(
+        req.usernames, include_key=fields == "all"
+    )
+
+
+@router.post("/heartbeat")
+async def heartbeat(current_user: str = Depends(get_current_user)):
+    """
+    Keep current user online.
+    Send every ~30s; users go offline after PRESENCE_TTL_SECONDS of silence.
+    """
+    presence.heartbeat(current_user)
+    return {"message": "ok"}
+
+
+@router.post("/presence", response_model=Dict[str, bool])
+async def get_presence(req: PresenceRequest, current_user: str = Depends(get_current_user)):
+    """Which of these users are online (username -> bool)"""
+    usernames = [auth_service.normalize_username(u) for u in req.usernames]
+    return await presence.online_status(usernames)
 
 
 @router.get("/{username}", response_model=UserPublicInfo)
-async def get_user(username: str, current_user: str = Depends(get_current_user)):
+async def get_user(
+    username: str,
+    request: Request,
+    fields: Literal["all", "fingerprint"] = Query("all", description="fingerprint = omit key"),
+    current_user: str = Depends(get_current_user),
+):
     """
     Get user's public info including PGP public key.
     Used for encrypting messages to this user.
+    Supports If-None-Match (ETag) and ?fields=fingerprint - fetch the
+    full key only when the fingerprint differs from the cached one.
     """
     try:
-        return await auth_service.get_user_public(username)
+        user = await auth_service.get_user_public(username, include_key=fields == "all")
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    return conditional_json(request, user)
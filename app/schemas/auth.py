@@ -1,4 +1,5 @@
 from pydantic import BaseModel, Field, field_validator
+from typing import List, Optional
 import re
 
 
@@ -50,10 +51,30 @@ class UserPublicInfo(BaseModel):
     """Public user info (returned to other users)"""
 
     username: str
-    pgp_public_key: str
+    pgp_public_key: Optional[str] = None  # null with ?fields=fingerprint
+    pgp_key_fingerprint: str  # Changes only when the key is replaced
     is_online: bool
 
 
+class BatchUserLookupRequest(BaseModel):
+    """Look up several users' public info at once"""
+
+    usernames: List[str] = Field(..., min_length=1, max_length=500)
+
+
+class BatchUserLookupResponse(BaseModel):
+    """Users found, plus requested usernames that don't exist"""
+
+    found: List[UserPublicInfo]
+    missing: List[str]
+
+
+class PresenceRequest(BaseModel):
+    """Ask which of these users are online"""
+
+    usernames: List[str] = Field(..., min_length=1, max_length=500)
+
+
 class UpdatePGPKeyRequest(BaseModel):
     """Update PGP public key (on reinstall)"""
 
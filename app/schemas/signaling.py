@@ -1,5 +1,7 @@
-from pydantic import BaseModel
-from typing import Literal, List
+from pydantic import BaseModel, Field, model_validator
+from typing import Literal, List, Optional, Union
+import base64
+import binascii
 
 
 class SignalSendRequest(BaseModel):
@@ -7,7 +9,30 @@ class SignalSendRequest(BaseModel):
 
     to_user: str  # @receiver username
     type: Literal["offer", "answer", "ice"]
-    encrypted_payload: str  # Server can't read this
+    # Server can't read this. Raw bytes in MessagePack/CBOR bodies;
+    # in JSON either armored text or base64 with encoding="base64"
+    encrypted_payload: Union[str, bytes]
+    encoding: Optional[Literal["base64"]] = None
+    # Answer/ICE: the generation of the offer they belong to
+    generation: Optional[int] = None
+    session_id: Optional[str] = None  # Handshake session (see /signaling/sessions)
+
+    @model_validator(mode="after")
+    def decode_base64(self):
+        # Store the raw bytes, not the base64 text
+        if self.encoding == "base64" and isinstance(self.encrypted_payload, str):
+            try:
+                self.encrypted_payload = base64.b64decode(self.encrypted_payload, validate=True)
+            except binascii.Error:
+                raise ValueError("encrypted_payload is not valid base64")
+            self.encoding = None
+        return self
+
+
+class SignalBatchSendRequest(BaseModel):
+    """Send several signals at once (trickle-ICE bursts)"""
+
+    signals: List[SignalSendRequest] = Field(..., min_length=1, max_length=100)
 
 
 class SignalMessage(BaseModel):
@@ -15,14 +40,20 @@ class SignalMessage(BaseModel):
 
     from_user: str
     type: Literal["offer", "answer", "ice"]
-    encrypted_payload: str
-    timestamp: str
+    # Raw bytes in MessagePack/CBOR responses; a list for coalesced ICE
+    encrypted_payload: Union[str, bytes, List[Union[str, bytes]]]
+    encoding: Optional[Literal["base64"]] = None  # JSON only: payload isn't UTF-8 text
+    generation: Optional[int] = None  # Negotiation generation (set by the offer)
+    session_id: Optional[str] = None
+    timestamp: Union[str, int]  # ISO 8601 in JSON, epoch milliseconds in binary formats
 
 
 class SignalPollResponse(BaseModel):
     """Response for polling signals"""
 
     messages: List[SignalMessage]
+    has_more: bool = False  # More pending - poll again right away
+    cursor: Optional[str] = None  # Leased batch id - pass back as ?ack=
 
 
 class ICEServersResponse(BaseModel):
@@ -30,3 +61,26 @@ class ICEServersResponse(BaseModel):
 
     stun_servers: List[str]
     turn_servers: List[dict]
+
+
+class HandshakeSessionCreate(BaseModel):
+    """Start a handshake with a connected user"""
+
+    peer: str  # @username
+
+
+class HandshakeSessionStateUpdate(BaseModel):
+    """Finish a handshake - remaining signals are purged"""
+
+    state: Literal["connected", "failed"]
+
+
+class HandshakeSessionInfo(BaseModel):
+    """Handshake session as seen by its participants"""
+
+    session_id: str
+    initiator: str
+    peer: str
+    state: Literal["created", "offered", "answered", "connected", "failed"]
+    created_at: str
+    updated_at: str
@@ -0,0 +1,72 @@
+"""
+Backfill email blind index
+Computes email_index for users registered before it existed.
+
+Usage:
+    python -m app.scripts.backfill_email_index
+"""
+
+import asyncio
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app.db.mongodb import connect_db, close_db, get_database
+from app.utils.security import decrypt_email, email_blind_index
+
+BATCH_SIZE = 500
+
+
+async def backfill_email_index() -> dict:
+    """Set email_index on every user missing it, in bulk batches"""
+    db = get_database()
+
+    updated = 0
+    failed = []
+    cursor = db.users.find(
+        {"email_index": {"$exists": False}},
+        {"_id": 1, "username": 1, "email_encrypted": 1},
+    )
+
+    batch = []
+    async for user in cursor:
+        batch.append(user)
+        if len(batch) >= BATCH_SIZE:
+            updated += await _flush(db, batch, failed)
+            batch = []
+
+    if batch:
+        updated += await _flush(db, batch, failed)
+
+    return {"updated": updated, "failed": failed}
+
+
+async def _flush(db, users: list, failed: list) -> int:
+    """Write one batch; duplicate emails are reported, not fatal"""
+    ops = [
+        UpdateOne(
+            {"_id": u["_id"]},
+            {"$set": {"email_index": email_blind_index(decrypt_email(u["email_encrypted"]))}},
+        )
+        for u in users
+    ]
+    try:
+        result = await db.users.bulk_write(ops, ordered=False)
+        return result.modified_count
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            failed.append(users[error["index"]]["username"])
+        return e.details.get("nModified", 0)
+
+
+async def main():
+    await connect_db()
+    try:
+        result = await backfill_email_index()
+        print(f"Backfilled email_index for {result['updated']} users")
+        if result["failed"]:
+            print(f"Duplicate emails, not indexed: {', '.join(result['failed'])}")
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+"""
+Backfill connection pair keys
+Sets pair_key on pending/accepted connection requests created before it
+existed. Duplicate active requests for the same pair are reported.
+
+Usage:
+    python -m app.scripts.backfill_pair_keys
+"""
+
+import asyncio
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from app.db.mongodb import connect_db, close_db, get_database
+from app.services.connection_graph import pair_key
+
+BATCH_SIZE = 500
+
+
+async def backfill_pair_keys() -> dict:
+    """Set pair_key on every active request missing it, in bulk batches"""
+    db = get_database()
+
+    updated = 0
+    failed = []
+    cursor = db.connection_requests.find(
+        {"pair_key": {"$exists": False}, "status": {"$in": ["pending", "accepted"]}},
+        {"_id": 1, "from_user": 1, "to_user": 1},
+    ).sort("status", 1)  # "accepted" first, so it wins over a duplicate pending
+
+    batch = []
+    async for request in cursor:
+        batch.append(request)
+        if len(batch) >= BATCH_SIZE:
+            updated += await _flush(db, batch, failed)
+            batch = []
+
+    if batch:
+        updated += await _flush(db, batch, failed)
+
+    return {"updated": updated, "failed": failed}
+
+
+async def _flush(db, requests: list, failed: list) -> int:
+    """Write one batch; duplicate pairs are reported, not fatal"""
+    ops = [
+        UpdateOne(
+            {"_id": r["_id"]},
+            {"$set": {"pair_key": pair_key(r["from_user"], r["to_user"])}},
+        )
+        for r in requests
+    ]
+    try:
+        result = await db.connection_requests.bulk_write(ops, ordered=False)
+        return result.modified_count
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            failed.append(str(requests[error["index"]]["_id"]))
+        return e.details.get("nModified", 0)
+
+
+async def main():
+    await connect_db()
+    try:
+        result = await backfill_pair_keys()
+        print(f"Backfilled pair_key for {result['updated']} connection requests")
+        if result["failed"]:
+            print(f"Duplicate pairs, not keyed (request _id): {', '.join(result['failed'])}")
+    finally:
+        await close_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
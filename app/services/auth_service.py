@@ -1,12 +1,17 @@
-from app.db.mongodb import get_database
+from app.db.mongodb import get_database, get_collection
 from app.schemas.auth import RegisterRequest, UserPublicInfo
 from app.utils.security import (
-    hash_password,
-    verify_password,
     create_access_token,
     encrypt_email,
+    email_blind_index,
+    pgp_key_fingerprint,
 )
+from app.utils.password_pool import hash_password_async, verify_password_async
+from app.services.presence_service import presence
+from app.services.email_outbox import email_outbox
 from datetime import datetime, timedelta
+from typing import List, Optional
+from pymongo.errors import DuplicateKeyError
 
 
 async def register_user(req: RegisterRequest) -> dict:
@@ -28,15 +33,22 @@ async def register_user(req: RegisterRequest) -> dict:
     user_doc = {
         "username": req.username,
         "email_encrypted": encrypt_email(req.email),
+        "email_index": email_blind_index(req.email),  # For login by email
         "birthday_encrypted": encrypt_email(req.birthday),  # Same encryption as email
-        "password_hash": hash_password(req.password),
+        "password_hash": await hash_password_async(req.password),
         "pgp_public_key": req.pgp_public_key,
+        "pgp_key_fingerprint": pgp_key_fingerprint(req.pgp_public_key),
         "is_online": False,
         "last_seen": datetime.utcnow(),
         "created_at": datetime.utcnow(),
     }
 
-    await db.users.insert_one(user_doc)
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError as e:
+        if "email_index" in str(e):
+            raise ValueError("Email already registered")
+        raise ValueError("Username already taken")
 
     # Return JWT token
     token = create_access_token({"sub": req.username})
@@ -52,59 +64,122 @@ async def login_user(username: str, password: str) -> dict:
 
     # Check if it looks like an email
     if "@" in identifier and "." in identifier and not identifier.startswith("@"):
-        # It's an email - encrypt it and search
-        encrypted_email = encrypt_email(identifier)
-        user = await db.users.find_one({"email_encrypted": encrypted_email})
+        # It's an email - look up by its blind index
+        user = await db.users.find_one({"email_index": email_blind_index(identifier)})
     else:
         # It's a username - normalize and search
         if not identifier.startswith("@"):
             identifier = f"@{identifier}"
         user = await db.users.find_one({"username": identifier})
 
-    if not user or not verify_password(password, user["password_hash"]):
+    if not user or not await verify_password_async(password, user["password_hash"]):
         raise ValueError("Invalid credentials")
 
     final_username = user["username"]
 
-    # Update online status
-    await db.users.update_one(
-        {"username": final_username},
-        {"$set": {"is_online": True, "last_seen": datetime.utcnow()}},
-    )
+    # Update online status (persisted write-behind)
+    presence.heartbeat(final_username)
 
     token = create_access_token({"sub": final_username})
     return {"access_token": token, "token_type": "bearer", "username": final_username}
 
 
-async def get_user_public(username: str) -> UserPublicInfo:
-    """Get public info of a user (for key exchange)"""
-    db = get_database()
+def to_public_info(user: dict, include_key: bool = True) -> UserPublicInfo:
+    """Build public info from a user document"""
+    # Users registered before fingerprints were stored get one computed
+    fingerprint = user.get("pgp_key_fingerprint") or pgp_key_fingerprint(
+        user["pgp_public_key"]
+    )
+    return UserPublicInfo(
+        username=user["username"],
+        pgp_public_key=user["pgp_public_key"] if include_key else None,
+        pgp_key_fingerprint=fingerprint,
+        is_online=presence.is_online(user),
+    )
+
 
+PUBLIC_INFO_PROJECTION = {
+    "_id": 0,
+    "username": 1,
+    "pgp_public_key": 1,
+    "pgp_key_fingerprint": 1,
+    "is_online": 1,
+    "last_seen": 1,
+}
+
+
+def normalize_username(username: str) -> str:
+    """'Alice' / '@Alice' -> '@alice'"""
     if not username.startswith("@"):
         username = f"@{username}"
+    return username.lower()
+
 
-    user = await db.users.find_one({"username": username.lower()})
+async def get_user_public(username: str, include_key: bool = True) -> UserPublicInfo:
+    """Get public info of a user (for key exchange)"""
+    # Primary - a key fetched for key exchange must not be stale
+    db = get_database()
+
+    user = await db.users.find_one(
+        {"username": normalize_username(username)}, PUBLIC_INFO_PROJECTION
+    )
     if not user:
         raise ValueError("User not found")
 
-    return UserPublicInfo(
-        username=user["username"],
-        pgp_public_key=user["pgp_public_key"],
-        is_online=user.get("is_online", False),
-    )
+    return to_public_info(user, include_key)
 
 
-async def search_users(query: str, limit: int = 20) -> list:
-    """Search users by username prefix"""
+async def get_users_public_batch(usernames: List[str], include_key: bool = True) -> dict:
+    """
+    Resolve many users' public info with one $in query.
+    Returns found users and the (normalized) usernames that don't exist.
+    """
+    # Primary - keys and fingerprints are used for key exchange
     db = get_database()
 
-    if not query.startswith("@"):
-        query = f"@{query}"
+    wanted = list(dict.fromkeys(normalize_username(u) for u in usernames))
 
-    cursor = db.users.find(
-        {"username": {"$regex": f"^{query.lower()}", "$options": "i"}},
-        {"_id": 0, "username": 1, "pgp_public_key": 1, "is_online": 1},
-    ).limit(limit)
+    users = await db.users.find(
+        {"username": {"$in": wanted}}, PUBLIC_INFO_PROJECTION
+    ).to_list(length=len(wanted))
+    by_username = {u["username"]: u for u in users}
+
+    return {
+        "found": [to_public_info(by_username[u], include_key) for u in wanted if u in by_username],
+        "missing": [u for u in wanted if u not in by_username],
+    }
+
+
+async def search_users(query: str, limit: int = 20, after: Optional[str] = None) -> list:
+    """
+    Search users by username prefix.
+    Usernames are stored lowercased, so the prefix becomes an anchored
+    range on the unique username index (no regex, no collection scan).
+    Pass the last username of a page as `after` to get the next one.
+    Discovery only, so secondary reads are fine - keys in the results may
+    lag; key exchange fetches them with get_user_public.
+    """
+    collection = get_collection("users", "search")
+
+    prefix = query.strip().lower()
+    if not prefix.startswith("@"):
+        prefix = f"@{prefix}"
+
+    # Smallest string greater than every string starting with prefix
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    lower = max(prefix, after.lower()) if after else prefix
+
+    username_range = {"$lt": upper}
+    username_range["$gt" if after else "$gte"] = lower
+
+    cursor = (
+        collection.find(
+            {"username": username_range},
+            PUBLIC_INFO_PROJECTION,
+        )
+        .sort("username", 1)
+        .limit(limit)
+    )
 
     return await cursor.to_list(length=limit)
 
@@ -114,18 +189,15 @@ async def update_pgp_key(username: str, new_key: str) -> bool:
     db = get_database()
 
     result = await db.users.update_one(
-        {"username": username}, {"$set": {"pgp_public_key": new_key}}
+        {"username": username},
+        {"$set": {"pgp_public_key": new_key, "pgp_key_fingerprint": pgp_key_fingerprint(new_key)}},
     )
     return result.modified_count > 0
 
 
 async def set_user_offline(username: str):
-    """Mark user as offline"""
-    db = get_database()
-    await db.users.update_one(
-        {"username": username},
-        {"$set": {"is_online": False, "last_seen": datetime.utcnow()}},
-    )
+    """Mark user as offline (persisted write-behind)"""
+    presence.set_offline(username)
 
 
 import random
@@ -156,7 +228,7 @@ async def request_password_reset(username: str) -> dict:
     - Decrypt email
     - Generate OTP
     - Store OTP with expiry (10 mins)
-    - For debug: log OTP to console
+    - Queue the OTP email (or, without SMTP, log OTP to console)
     - Return email hint
     """
     from app.utils.security import decrypt_email
@@ -185,16 +257,24 @@ async def request_password_reset(username: str) -> dict:
         {"$set": {"reset_otp": otp, "reset_otp_expires": otp_expires}},
     )
 
-    # For DEBUG: print OTP to console
-    print(f"\n{'='*50}")
-    print(f"🔐 PASSWORD RESET OTP for {username}")
-    print(f"📧 Email: {email}")
-    print(f"🔢 OTP: {otp}")
-    print(f"⏰ Expires: {otp_expires}")
-    print(f"{'='*50}\n")
-
-    # TODO: In production, send email with OTP
-    # await send_email(email, f"Your OTP is: {otp}")
+    if email_outbox.enabled:
+        # Queued - delivered in the background, the request doesn't wait on SMTP
+        await email_outbox.enqueue(
+            email,
+            "Your Handshaker password reset code",
+            f"Your password reset code is: {otp}\n\n"
+            "It expires in 10 minutes. If you didn't ask to reset your "
+            "password, you can ignore this email.\n",
+            expires_at=otp_expires,
+        )
+    else:
+        # For DEBUG (no SMTP_HOST): print OTP to console
+        print(f"\n{'='*50}")
+        print(f"🔐 PASSWORD RESET OTP for {username}")
+        print(f"📧 Email: {email}")
+        print(f"🔢 OTP: {otp}")
+        print(f"⏰ Expires: {otp_expires}")
+        print(f"{'='*50}\n")
 
     return {
         "message": "OTP sent to your registered email",
@@ -237,7 +317,7 @@ async def reset_password(username: str, otp: str, new_password: str) -> dict:
     await db.users.update_one(
         {"username": username},
         {
-            "$set": {"password_hash": hash_password(new_password)},
+            "$set": {"password_hash": await hash_password_async(new_password)},
             "$unset": {"reset_otp": "", "reset_otp_expires": ""},
         },
     )
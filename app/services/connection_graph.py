@@ -0,0 +1,90 @@
+"""
+Connection Graph
+Cached adjacency of accepted connections for hot-path authorization
+"""
+
+import time
+from collections import OrderedDict
+from typing import FrozenSet, Tuple
+from app.db.mongodb import get_database
+from app.services.signal_bus import signal_bus
+from app.config import settings
+
+
+def pair_key(user_a: str, user_b: str) -> str:
+    """Order-independent key for a pair of users"""
+    return "|".join(sorted((user_a, user_b)))
+
+
+class ConnectionGraph:
+    """
+    Per-user set of accepted peers, loaded lazily with one indexed query.
+    Entries are invalidated on every worker (over the signal bus) when a
+    connection is accepted or removed, and expire after ttl_seconds as a
+    backstop should an invalidation be missed.
+    A miss reloads at most once per miss_reload_seconds, so a freshly
+    accepted connection on another worker is picked up quickly without
+    letting unconnected senders trigger a query per signal.
+    """
+
+    def __init__(self, max_users: int, ttl_seconds: int, miss_reload_seconds: int):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self.miss_reload_seconds = miss_reload_seconds
+        self._peers: "OrderedDict[str, Tuple[FrozenSet[str], float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    async def _load(self, username: str) -> FrozenSet[str]:
+        db = get_database()
+        cursor = db.connection_requests.find(
+            {"$or": [{"from_user": username}, {"to_user": username}], "status": "accepted"},
+            {"_id": 0, "from_user": 1, "to_user": 1},
+        )
+        peers = frozenset(
+            [c["to_user"] if c["from_user"] == username else c["from_user"] async for c in cursor]
+        )
+        self._peers[username] = (peers, time.monotonic())
+        self._peers.move_to_end(username)
+        while len(self._peers) > self.max_users:
+            self._peers.popitem(last=False)
+        return peers
+
+    async def peers(self, username: str) -> FrozenSet[str]:
+        """Accepted peers of a user (cached)"""
+        entry = self._peers.get(username)
+        if entry is None or time.monotonic() - entry[1] > self.ttl_seconds:
+            self.misses += 1
+            return await self._load(username)
+        self.hits += 1
+        self._peers.move_to_end(username)
+        return entry[0]
+
+    async def are_connected(self, username: str, other: str) -> bool:
+        """O(1) in-memory check once the user's peers are cached"""
+        if other in await self.peers(username):
+            return True
+        loaded_at = self._peers[username][1] if username in self._peers else 0
+        if time.monotonic() - loaded_at > self.miss_reload_seconds:
+            return other in await self._load(username)
+        return False
+
+    def invalidate(self, *usernames: str):
+        """Drop cached peers in this worker (bus handler)"""
+        for username in usernames:
+            self._peers.pop(username, None)
+
+    async def changed(self, *usernames: str):
+        """A connection between these users was accepted or removed"""
+        self.invalidate(*usernames)
+        await signal_bus.publish_invalidation(list(usernames))
+
+    def stats(self) -> dict:
+        return {"size": len(self._peers), "hits": self.hits, "misses": self.misses}
+
+
+connection_graph = ConnectionGraph(
+    settings.CONNECTION_CACHE_SIZE,
+    settings.CONNECTION_CACHE_TTL_SECONDS,
+    settings.CONNECTION_CACHE_MISS_RELOAD_SECONDS,
+)
@@ -4,8 +4,13 @@ Handles connection requests between users
 """
 
 from app.db.mongodb import get_database
+from app.utils.security import pgp_key_fingerprint
+from app.services.presence_service import presence
+from app.services.connection_graph import connection_graph, pair_key
 from datetime import datetime
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from typing import Optional, Tuple
 
 
 async def send_connection_request(from_user: str, to_user: str) -> dict:
@@ -22,16 +27,10 @@ async def send_connection_request(from_user: str, to_user: str) -> dict:
     if from_user == to_user:
         raise ValueError("Cannot connect to yourself")
 
-    # Check if request already exists
-    existing = await db.connection_requests.find_one(
-        {
-            "$or": [
-                {"from_user": from_user, "to_user": to_user},
-                {"from_user": to_user, "to_user": from_user},
-            ],
-            "status": {"$in": ["pending", "accepted"]},
-        }
-    )
+    # Check if request already exists (pair_key is only set while
+    # pending/accepted, and is unique)
+    key = pair_key(from_user, to_user)
+    existing = await db.connection_requests.find_one(_pair_query(from_user, to_user))
 
     if existing:
         if existing["status"] == "accepted":
@@ -42,11 +41,16 @@ async def send_connection_request(from_user: str, to_user: str) -> dict:
     request = {
         "from_user": from_user,
         "to_user": to_user,
+        "pair_key": key,
         "status": "pending",
         "created_at": datetime.utcnow(),
     }
 
-    result = await db.connection_requests.insert_one(request)
+    try:
+        result = await db.connection_requests.insert_one(request)
+    except DuplicateKeyError:
+        # Lost a race with a concurrent request for the same pair
+        raise ValueError("Request already pending")
 
     return {
         "request_id": str(result.inserted_id),
@@ -57,25 +61,84 @@ async def send_connection_request(from_user: str, to_user: str) -> dict:
     }
 
 
-async def get_pending_requests(username: str) -> list:
-    """Get all pending requests for a user (incoming)"""
+def _pair_query(user_a: str, user_b: str) -> dict:
+    """
+    Pending/accepted request between two users, either direction.
+    The from/to branches also match rows created before pair keys
+    (backfill_pair_keys not run yet); every branch is index-backed.
+    """
+    live = {"$in": ["pending", "accepted"]}
+    return {
+        "$or": [
+            {"pair_key": pair_key(user_a, user_b)},
+            {"from_user": user_a, "to_user": user_b, "status": live},
+            {"from_user": user_b, "to_user": user_a, "status": live},
+        ]
+    }
+
+
+def _encode_cursor(doc: dict) -> str:
+    """Keyset cursor for the last item of a page"""
+    return f"{doc['created_at'].isoformat()}|{doc['_id']}"
+
+
+def _after_cursor(cursor: str) -> dict:
+    """Filter for items strictly after the cursor in (created_at, _id) order"""
+    try:
+        created_at, doc_id = cursor.split("|")
+        created_at, doc_id = datetime.fromisoformat(created_at), ObjectId(doc_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+    return {
+        "$or": [
+            {"created_at": {"$gt": created_at}},
+            {"created_at": created_at, "_id": {"$gt": doc_id}},
+        ]
+    }
+
+
+async def _find_page(query: dict, limit: int, after: Optional[str], projection=None):
+    """One keyset page ordered by (created_at, _id) -> (docs, next cursor)"""
     db = get_database()
 
-    cursor = db.connection_requests.find({"to_user": username, "status": "pending"})
-
-    requests = []
-    async for req in cursor:
-        requests.append(
-            {
-                "request_id": str(req["_id"]),
-                "from_user": req["from_user"],
-                "to_user": req["to_user"],
-                "status": req["status"],
-                "created_at": req["created_at"].isoformat(),
-            }
-        )
+    if after:
+        query = {"$and": [query, _after_cursor(after)]}
 
-    return requests
+    docs = await (
+        db.connection_requests.find(query, projection)
+        .sort([("created_at", 1), ("_id", 1)])
+        .limit(limit + 1)
+        .to_list(length=limit + 1)
+    )
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, _encode_cursor(docs[-1])
+    return docs, None
+
+
+async def get_pending_requests(
+    username: str, limit: int = 50, after: Optional[str] = None
+) -> Tuple[list, Optional[str]]:
+    """
+    Get a page of pending requests for a user (incoming), oldest first.
+    Returns (requests, cursor for the next page or None).
+    """
+    docs, next_cursor = await _find_page(
+        {"to_user": username, "status": "pending"}, limit, after
+    )
+
+    requests = [
+        {
+            "request_id": str(req["_id"]),
+            "from_user": req["from_user"],
+            "to_user": req["to_user"],
+            "status": req["status"],
+            "created_at": req["created_at"].isoformat(),
+        }
+        for req in docs
+    ]
+
+    return requests, next_cursor
 
 
 async def respond_to_request(request_id: str, action: str, username: str) -> dict:
@@ -98,11 +161,13 @@ async def respond_to_request(request_id: str, action: str, username: str) -> dic
 
     new_status = "accepted" if action == "accept" else "declined"
 
-    # Update request status
-    await db.connection_requests.update_one(
-        {"_id": ObjectId(request_id)},
-        {"$set": {"status": new_status, "responded_at": datetime.utcnow()}},
-    )
+    # Update request status - declined requests release the pair_key
+    update = {"$set": {"status": new_status, "responded_at": datetime.utcnow()}}
+    if new_status == "declined":
+        update["$unset"] = {"pair_key": ""}
+    await db.connection_requests.update_one({"_id": ObjectId(request_id)}, update)
+    if new_status == "accepted":
+        await connection_graph.changed(request["from_user"], request["to_user"])
 
     return {
         "request_id": request_id,
@@ -112,27 +177,54 @@ async def respond_to_request(request_id: str, action: str, username: str) -> dic
     }
 
 
-async def get_connections(username: str) -> list:
-    """Get all accepted connections for a user"""
-    db = get_database()
-
-    cursor = db.connection_requests.find(
-        {"$or": [{"from_user": username}, {"to_user": username}], "status": "accepted"}
+async def get_connections(
+    username: str, limit: int = 100, after: Optional[str] = None
+) -> Tuple[list, Optional[str]]:
+    """
+    Get a page of accepted connections for a user, oldest first.
+    The page is joined with users in one projected $in lookup.
+    Returns (connections, cursor for the next page or None).
+    """
+    docs, next_cursor = await _find_page(
+        {"$or": [{"from_user": username}, {"to_user": username}], "status": "accepted"},
+        limit,
+        after,
+        {"from_user": 1, "to_user": 1, "created_at": 1, "responded_at": 1},
     )
+    return await _resolve_connections(username, docs), next_cursor
 
-    connections = []
-    async for conn in cursor:
-        # Get the other user
-        other = conn["to_user"] if conn["from_user"] == username else conn["from_user"]
 
-        # Get other user's info
-        user_info = await db.users.find_one({"username": other})
+async def _resolve_connections(username: str, conns: list) -> list:
+    """Join a page of connection requests with the other users' public info"""
+    # Get the other user of each connection
+    others = [c["to_user"] if c["from_user"] == username else c["from_user"] for c in conns]
+
+    # Primary - the connection list hands out keys used for key exchange
+    users = await get_database().users.find(
+        {"username": {"$in": others}},
+        {
+            "_id": 0,
+            "username": 1,
+            "pgp_public_key": 1,
+            "pgp_key_fingerprint": 1,
+            "is_online": 1,
+            "last_seen": 1,
+        },
+    ).to_list(length=len(others))
+    by_username = {u["username"]: u for u in users}
+
+    connections = []
+    for other, conn in zip(others, conns):
+        user_info = by_username.get(other)
         if user_info:
+            public_key = user_info.get("pgp_public_key", "")
             connections.append(
                 {
                     "username": other,
-                    "pgp_public_key": user_info.get("pgp_public_key", ""),
-                    "is_online": user_info.get("is_online", False),
+                    "pgp_public_key": public_key,
+                    "pgp_key_fingerprint": user_info.get("pgp_key_fingerprint")
+                    or pgp_key_fingerprint(public_key),
+                    "is_online": presence.is_online(user_info),
                     "connected_at": conn.get(
                         "responded_at", conn["created_at"]
                     ).isoformat(),
@@ -147,13 +239,9 @@ async def remove_connection(username: str, other_user: str) -> bool:
     db = get_database()
 
     result = await db.connection_requests.delete_one(
-        {
-            "$or": [
-                {"from_user": username, "to_user": other_user},
-                {"from_user": other_user, "to_user": username},
-            ],
-            "status": "accepted",
-        }
+        {**_pair_query(username, other_user), "status": "accepted"}
     )
+    if result.deleted_count:
+        await connection_graph.changed(username, other_user)
 
     return result.deleted_count > 0
@@ -0,0 +1,266 @@
+"""
+Email Outbox
+Durable queue of outgoing emails (email_outbox collection). Requests
+only insert a job; background workers claim batches, deliver them over
+pooled SMTP connections and retry failures with exponential backoff.
+"""
+
+import asyncio
+import random
+import uuid
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import List, Optional, Tuple
+from pymongo import UpdateOne
+from app.db.mongodb import get_database
+from app.utils.metrics import registry
+from app.utils.security import decrypt_email, encrypt_email
+from app.utils.smtp_pool import SMTPPool
+from app.config import settings
+
+email_delivery_delay = registry.histogram(
+    "email_delivery_delay_seconds",
+    "Time from enqueue to hand-off to the SMTP server (retries included)",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900),
+)
+
+
+def _outbox():
+    """Default (majority) write concern - an accepted job must not be lost"""
+    return get_database().email_outbox
+
+
+class EmailOutbox:
+    """
+    Jobs are leased rather than deleted when claimed, so a worker that
+    dies mid-batch only delays delivery until the lease runs out
+    (at-least-once). The lease is renewed while a batch is being sent,
+    however slow the SMTP server, so a live worker's batch is never
+    picked up (and mailed twice) by another. Sent jobs are deleted;
+    failed ones are kept until their expires_at for inspection.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        batch_size: int,
+        poll_seconds: float,
+        lease_seconds: int,
+        max_attempts: int,
+        retry_base_seconds: float,
+        retry_max_seconds: float,
+    ):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.pool = SMTPPool(workers)
+        self._wake = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self.enqueued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        """Without SMTP_HOST nothing is sent (OTPs are printed instead)"""
+        return bool(settings.SMTP_HOST)
+
+    async def enqueue(
+        self, to: str, subject: str, body: str, expires_at: Optional[datetime] = None
+    ):
+        """
+        Store an email for delivery. expires_at bounds retries - e.g. an
+        OTP mail is useless once the OTP has expired.
+        """
+        now = datetime.utcnow()
+        await _outbox().insert_one(
+            {
+                # Addresses are encrypted at rest, like users.email_encrypted
+                "to_encrypted": encrypt_email(to),
+                "subject": subject,
+                "body": body,
+                "status": "pending",
+                "attempts": 0,
+                "next_attempt_at": now,
+                "created_at": now,
+                "expires_at": expires_at
+                or now + timedelta(seconds=settings.EMAIL_OUTBOX_RETENTION_SECONDS),
+            }
+        )
+        self.enqueued += 1
+        self._wake.set()
+
+    async def _claim(self) -> Tuple[List[dict], Optional[str]]:
+        """Lease up to batch_size due jobs, oldest due first. Returns (jobs, claim_id)."""
+        outbox = _outbox()
+        now = datetime.utcnow()
+        jobs = await outbox.find(
+            {
+                "status": "pending",
+                "next_attempt_at": {"$lte": now},
+                "expires_at": {"$gt": now},
+                "lease_until": {"$not": {"$gt": now}},
+            }
+        ).sort("next_attempt_at", 1).to_list(length=self.batch_size)
+        if not jobs:
+            return [], None
+
+        claim_id = uuid.uuid4().hex
+        job_ids = [job["_id"] for job in jobs]
+        result = await outbox.update_many(
+            {"_id": {"$in": job_ids}, "lease_until": {"$not": {"$gt": now}}},
+            {
+                "$set": {
+                    "claim_id": claim_id,
+                    "lease_until": now + timedelta(seconds=self.lease_seconds),
+                }
+            },
+        )
+        if result.modified_count < len(jobs):
+            # Lost part of the batch to another worker - keep what we won
+            won = await outbox.find(
+                {"_id": {"$in": job_ids}, "claim_id": claim_id}, {"_id": 1}
+            ).to_list(length=len(jobs))
+            won_ids = {w["_id"] for w in won}
+            jobs = [job for job in jobs if job["_id"] in won_ids]
+        return jobs, claim_id
+
+    async def _renew_lease(self, jobs: List[dict], claim_id: str):
+        """Extend a batch's lease every third of it until cancelled"""
+        job_ids = [job["_id"] for job in jobs]
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            lease_until = datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+            try:
+                await _outbox().update_many(
+                    {"_id": {"$in": job_ids}, "claim_id": claim_id},
+                    {"$set": {"lease_until": lease_until}},
+                )
+            except Exception as e:
+                print(f"Email outbox lease renewal failed, retrying: {e}")
+
+    def _message(self, job: dict) -> EmailMessage:
+        message = EmailMessage()
+        message["From"] = settings.SMTP_FROM
+        message["To"] = decrypt_email(job["to_encrypted"])
+        message["Subject"] = job["subject"]
+        message.set_content(job["body"])
+        return message
+
+    def _backoff(self, attempts: int) -> float:
+        """Exponential, capped, with jitter so a burst doesn't retry in lockstep"""
+        delay = min(self.retry_max_seconds, self.retry_base_seconds * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    async def deliver_batch(self) -> int:
+        """Claim and send one batch. Returns the number of jobs claimed."""
+        jobs, claim_id = await self._claim()
+        if not jobs:
+            return 0
+
+        sendable, results = [], {}
+        for job in jobs:
+            try:
+                sendable.append((job, self._message(job)))
+            except Exception as e:
+                results[job["_id"]] = (f"build: {e}", True)
+        if sendable:
+            # A batch may take up to batch_size SMTP timeouts - keep it leased
+            renewal = asyncio.create_task(self._renew_lease(jobs, claim_id))
+            try:
+                sent = await asyncio.to_thread(
+                    self.pool.send_batch, [message for _, message in sendable]
+                )
+            finally:
+                renewal.cancel()
+            for (job, _), result in zip(sendable, sent):
+                results[job["_id"]] = result
+
+        now = datetime.utcnow()
+        done, ops = [], []
+        for job in jobs:
+            error, permanent = results[job["_id"]]
+            if error is None:
+                done.append(job["_id"])
+                email_delivery_delay.observe((now - job["created_at"]).total_seconds())
+                continue
+            attempts = job["attempts"] + 1
+            update = {"attempts": attempts, "last_error": error[:500]}
+            if permanent or attempts >= self.max_attempts:
+                update["status"] = "failed"
+                self.failed += 1
+                print(f"Email {job['_id']} failed after {attempts} attempt(s): {error}")
+            else:
+                update["next_attempt_at"] = now + timedelta(seconds=self._backoff(attempts))
+                self.retried += 1
+            ops.append(
+                UpdateOne(
+                    {"_id": job["_id"]},
+                    {"$set": update, "$unset": {"claim_id": "", "lease_until": ""}},
+                )
+            )
+
+        outbox = _outbox()
+        if done:
+            await outbox.delete_many({"_id": {"$in": done}})
+            self.sent += len(done)
+        if ops:
+            await outbox.bulk_write(ops, ordered=False)
+        return len(jobs)
+
+    async def _run(self):
+        while True:
+            # Cleared before claiming, so a job enqueued meanwhile isn't missed
+            self._wake.clear()
+            try:
+                claimed = await self.deliver_batch()
+            except Exception as e:
+                print(f"Email outbox round failed, retrying: {e}")
+                claimed = 0
+            if claimed < self.batch_size:
+                # Caught up - wait for a new job here or the next poll (jobs
+                # from other workers and retries coming due)
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    def start(self):
+        if self.enabled and not self._tasks:
+            self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        await asyncio.to_thread(self.pool.close)
+
+    def stats(self) -> dict:
+        return {
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            **self.pool.stats(),
+        }
+
+
+email_outbox = EmailOutbox(
+    workers=settings.EMAIL_OUTBOX_WORKERS,
+    batch_size=settings.EMAIL_OUTBOX_BATCH_SIZE,
+    poll_seconds=settings.EMAIL_OUTBOX_POLL_SECONDS,
+    lease_seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS,
+    max_attempts=settings.EMAIL_OUTBOX_MAX_ATTEMPTS,
+    retry_base_seconds=settings.EMAIL_OUTBOX_RETRY_BASE_SECONDS,
+    retry_max_seconds=settings.EMAIL_OUTBOX_RETRY_MAX_SECONDS,
+)
@@ -0,0 +1,182 @@
+"""
+Handshake Service
+Handshake sessions: created -> offered -> answered -> connected | failed.
+Signals tagged with a session are purged in bulk once it finishes.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from app.db.mongodb import get_collection
+from app.schemas.signaling import HandshakeSessionInfo
+from app.services.connection_graph import connection_graph, pair_key
+from app.services.signal_store import signal_store
+from app.config import settings
+
+FINISHED = ("connected", "failed")
+
+# State a signal moves the session to, and the states it may come from.
+# A new offer in offered/answered is a renegotiation (e.g. ICE restart).
+SIGNAL_TRANSITIONS = {
+    "offer": ("offered", ["created", "offered", "answered"]),
+    "answer": ("answered", ["offered"]),
+}
+
+
+def _sessions():
+    """Sessions are short-lived - fast (w=1) writes like signals"""
+    return get_collection("handshake_sessions", "ephemeral")
+
+
+def _object_id(session_id: str) -> ObjectId:
+    try:
+        return ObjectId(session_id)
+    except (InvalidId, TypeError):
+        raise ValueError("Session not found")
+
+
+def _to_info(session: dict) -> HandshakeSessionInfo:
+    return HandshakeSessionInfo(
+        session_id=str(session["_id"]),
+        initiator=session["initiator"],
+        peer=session["peer"],
+        state=session["state"],
+        created_at=session["created_at"].isoformat(),
+        updated_at=session["updated_at"].isoformat(),
+    )
+
+
+def _participant(username: str) -> dict:
+    return {"$or": [{"initiator": username}, {"peer": username}]}
+
+
+async def create_session(username: str, peer: str) -> HandshakeSessionInfo:
+    """Open a session with a connected user"""
+    if not peer.startswith("@"):
+        peer = f"@{peer}"
+    peer = peer.lower()
+    if peer == username:
+        raise ValueError("Cannot start a handshake with yourself")
+    if settings.SIGNAL_REQUIRE_CONNECTION and not await connection_graph.are_connected(
+        username, peer
+    ):
+        raise ValueError(f"Not connected to {peer}")
+
+    now = datetime.utcnow()
+    session = {
+        "initiator": username,
+        "peer": peer,
+        "pair_key": pair_key(username, peer),
+        "state": "created",
+        "created_at": now,
+        "updated_at": now,
+        "expires_at": now + timedelta(seconds=settings.HANDSHAKE_SESSION_TTL_SECONDS),
+    }
+    result = await _sessions().insert_one(session)
+    session["_id"] = result.inserted_id
+    return _to_info(session)
+
+
+async def get_session(username: str, session_id: str) -> HandshakeSessionInfo:
+    """Session info, for participants only"""
+    session = await _sessions().find_one(
+        {"_id": _object_id(session_id), **_participant(username)}
+    )
+    if not session:
+        raise ValueError("Session not found")
+    return _to_info(session)
+
+
+async def advance_for_signals(
+    from_user: str, signals: List[Tuple[str, str, str]]
+) -> Dict[str, str]:
+    """
+    Check every session-tagged signal of a batch - (to_user, session_id,
+    type) - then move the sessions along for its offers/answers.
+    All sessions are checked (one lookup) before any is advanced, and
+    if one still loses a race to a concurrent change, those already
+    advanced are rolled back - a rejected batch leaves every session as
+    it was. ICE changes no state but must name a session of the sender
+    and its recipient too. Only the invited peer may answer.
+    Returns the new state per session an offer/answer advanced.
+    Raises ValueError if a session is unknown, finished, belongs to
+    another pair or isn't in a state that accepts the signal.
+    """
+    object_ids = {session_id: _object_id(session_id) for _, session_id, _ in signals}
+    found = await _sessions().find(
+        {"_id": {"$in": list(object_ids.values())}, "state": {"$nin": list(FINISHED)}},
+        {"pair_key": 1, "peer": 1, "state": 1, "updated_at": 1},
+    ).to_list(length=len(object_ids))
+    sessions = {str(session["_id"]): session for session in found}
+
+    states: Dict[str, str] = {}
+    for to_user, session_id, signal_type in signals:
+        session = sessions.get(str(object_ids[session_id]))
+        if not session or session["pair_key"] != pair_key(from_user, to_user):
+            raise ValueError(f"Session {session_id} not found")
+        transition = SIGNAL_TRANSITIONS.get(signal_type)
+        if transition is None:
+            continue
+        if signal_type == "answer" and from_user != session["peer"]:
+            raise ValueError(f"Only {session['peer']} can answer session {session_id}")
+        state, allowed_from = transition
+        key = str(session["_id"])
+        if states.get(key, session["state"]) not in allowed_from:
+            raise ValueError(f"Session {session_id} does not accept an {signal_type} now")
+        states[key] = state
+
+    now = datetime.utcnow()
+    advanced: List[Tuple[dict, str]] = []
+    for session_id, state in states.items():
+        session = sessions[session_id]
+        # Conditional on the state checked above - a concurrent change loses
+        result = await _sessions().update_one(
+            {"_id": session["_id"], "state": session["state"]},
+            {"$set": {"state": state, "updated_at": now}},
+        )
+        if result.matched_count == 0:
+            await _roll_back(advanced, now)
+            raise ValueError(f"Session {session_id} changed meanwhile, try again")
+        advanced.append((session, state))
+    return states
+
+
+async def _roll_back(advanced: List[Tuple[dict, str]], advanced_at: datetime):
+    """Undo advance_for_signals' updates - unless something moved a session since"""
+    for session, state in advanced:
+        await _sessions().update_one(
+            {"_id": session["_id"], "state": state, "updated_at": advanced_at},
+            {"$set": {"state": session["state"], "updated_at": session["updated_at"]}},
+        )
+
+
+async def finish_session(username: str, session_id: str, state: str) -> HandshakeSessionInfo:
+    """
+    Mark a session connected or failed and purge its remaining signals
+    in bulk. The session record lingers briefly so the other side can
+    read the outcome.
+    """
+    now = datetime.utcnow()
+    session = await _sessions().find_one_and_update(
+        {
+            "_id": _object_id(session_id),
+            **_participant(username),
+            "state": {"$nin": list(FINISHED)},
+        },
+        {
+            "$set": {
+                "state": state,
+                "updated_at": now,
+                "expires_at": now
+                + timedelta(seconds=settings.HANDSHAKE_SESSION_RETENTION_SECONDS),
+            }
+        },
+        return_document=ReturnDocument.AFTER,
+    )
+    if not session:
+        raise ValueError("Session not found or already finished")
+
+    await signal_store.purge_session(session_id, (session["initiator"], session["peer"]))
+    return _to_info(session)
@@ -0,0 +1,143 @@
+"""
+Presence Service
+Heartbeat-based online status with write-behind persistence
+"""
+
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from pymongo import UpdateOne
+from app.db.mongodb import get_collection, get_database
+from app.services.websocket_manager import manager
+from app.config import settings
+
+
+class PresenceTracker:
+    """
+    Keeps last heartbeat per user in memory (ordered oldest first, so
+    expiry only touches users that actually timed out) and flushes
+    is_online / last_seen to Mongo in coalesced bulk writes.
+
+    Other workers see a user as online only while the stored last_seen
+    is within the TTL, so a crashed client never stays online forever.
+    """
+
+    def __init__(self, ttl_seconds: int, flush_seconds: float):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.flush_seconds = flush_seconds
+        self._last_seen: "OrderedDict[str, datetime]" = OrderedDict()
+        self._persisted_at: Dict[str, datetime] = {}
+        self._dirty: Dict[str, Tuple[bool, datetime]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def heartbeat(self, username: str):
+        """Record activity - in memory only"""
+        now = datetime.utcnow()
+        self._last_seen[username] = now
+        self._last_seen.move_to_end(username)
+
+        # Persist the online transition, then refresh last_seen well
+        # before other workers would consider it stale
+        persisted = self._persisted_at.get(username)
+        if persisted is None or now - persisted > self.ttl / 3:
+            self._dirty[username] = (True, now)
+            self._persisted_at[username] = now
+
+    def set_offline(self, username: str):
+        """Explicit logout"""
+        self._last_seen.pop(username, None)
+        self._persisted_at.pop(username, None)
+        self._dirty[username] = (False, datetime.utcnow())
+
+    def is_online(self, user: dict) -> bool:
+        """
+        Online status for a user document (needs username, is_online
+        and last_seen). Local heartbeats win over the stored flag.
+        """
+        now = datetime.utcnow()
+        last_seen = self._last_seen.get(user["username"])
+        if last_seen is not None:
+            return now - last_seen <= self.ttl
+        if user["username"] in self._dirty:
+            return self._dirty[user["username"]][0]
+        stored = user.get("last_seen")
+        return bool(user.get("is_online")) and stored is not None and now - stored <= self.ttl
+
+    async def online_status(self, usernames: List[str]) -> Dict[str, bool]:
+        """Bulk "who of these is online" - one projected $in for the rest"""
+        result = {}
+        unknown = []
+        for username in usernames:
+            if username in self._last_seen or username in self._dirty:
+                result[username] = self.is_online({"username": username})
+            else:
+                unknown.append(username)
+
+        if unknown:
+            users = await get_database().users.find(
+                {"username": {"$in": unknown}},
+                {"_id": 0, "username": 1, "is_online": 1, "last_seen": 1},
+            ).to_list(length=len(unknown))
+            for user in users:
+                result[user["username"]] = self.is_online(user)
+            for username in unknown:
+                result.setdefault(username, False)
+
+        return result
+
+    def _expire(self):
+        """Mark users whose heartbeat is older than the TTL offline"""
+        now = datetime.utcnow()
+        while self._last_seen:
+            username, last_seen = next(iter(self._last_seen.items()))
+            if now - last_seen <= self.ttl:
+                break
+            if manager.is_connected(username):
+                # Open WebSocket counts as a heartbeat
+                self.heartbeat(username)
+                continue
+            del self._last_seen[username]
+            self._persisted_at.pop(username, None)
+            self._dirty[username] = (False, last_seen)
+
+    async def flush(self):
+        """Write pending changes in one bulk write"""
+        self._expire()
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        ops = [
+            UpdateOne(
+                {"username": username},
+                {"$set": {"is_online": online, "last_seen": last_seen}},
+            )
+            for username, (online, last_seen) in dirty.items()
+        ]
+        try:
+            await get_collection("users", "ephemeral").bulk_write(ops, ordered=False)
+        except Exception as e:
+            print(f"Presence flush failed, retrying next round: {e}")
+            for username, change in dirty.items():
+                self._dirty.setdefault(username, change)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_seconds)
+            await self.flush()
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+presence = PresenceTracker(settings.PRESENCE_TTL_SECONDS, settings.PRESENCE_FLUSH_SECONDS)
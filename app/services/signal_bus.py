@@ -0,0 +1,160 @@
+"""
+Signal Bus
+Cross-worker fan-out of stored signals to local WebSockets and pollers,
+and of connection changes to every worker's connection graph cache
+"""
+
+import asyncio
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional
+from pymongo.errors import PyMongoError
+from app.db.mongodb import get_database
+from app.config import settings
+
+SignalHandler = Callable[[dict], Awaitable[None]]
+# Called with the usernames whose connections changed
+InvalidationHandler = Callable[..., None]
+
+# Connection change events only need to outlive change stream delivery
+CONNECTION_EVENT_TTL_SECONDS = 300
+
+
+class SignalBus(ABC):
+    """
+    Fan-out interface.
+    Each worker subscribes once with a handler that routes a stored
+    signal document to its local sockets / waiters, and one that drops
+    cached connections of users whose connections changed.
+    """
+
+    def __init__(self):
+        self._handler: Optional[SignalHandler] = None
+        self._on_invalidate: Optional[InvalidationHandler] = None
+
+    async def start(
+        self, handler: SignalHandler, on_invalidate: Optional[InvalidationHandler] = None
+    ):
+        """Subscribe this worker"""
+        self._handler = handler
+        self._on_invalidate = on_invalidate
+
+    async def stop(self):
+        """Unsubscribe this worker"""
+        self._handler = None
+        self._on_invalidate = None
+
+    @abstractmethod
+    async def publish(self, signal: dict):
+        """Announce a newly stored signal to every subscribed worker"""
+
+    @abstractmethod
+    async def publish_invalidation(self, usernames: List[str]):
+        """Announce to every subscribed worker that these users' connections changed"""
+
+    async def _dispatch(self, signal: dict):
+        if not self._handler:
+            return
+        try:
+            await self._handler(signal)
+        except Exception as e:
+            # One bad event must not kill the subscription
+            print(f"Signal bus handler error: {e}")
+
+    def _dispatch_invalidation(self, usernames: List[str]):
+        if self._on_invalidate:
+            self._on_invalidate(*usernames)
+
+
+class InProcessSignalBus(SignalBus):
+    """Single-worker bus (also used in tests) - events never leave the process"""
+
+    async def publish(self, signal: dict):
+        await self._dispatch(signal)
+
+    async def publish_invalidation(self, usernames: List[str]):
+        self._dispatch_invalidation(usernames)
+
+
+class MongoChangeStreamSignalBus(SignalBus):
+    """
+    Multi-worker bus backed by one database change stream following
+    inserts into signaling and connection_events.
+    A signal insert itself is the event, so publish is a no-op;
+    invalidations are written to connection_events (TTL-expired).
+    Requires MongoDB running as a replica set.
+    """
+
+    RETRY_SECONDS = 1
+
+    def __init__(self):
+        super().__init__()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(
+        self, handler: SignalHandler, on_invalidate: Optional[InvalidationHandler] = None
+    ):
+        await super().start(handler, on_invalidate)
+        self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await super().stop()
+
+    async def publish(self, signal: dict):
+        pass
+
+    async def publish_invalidation(self, usernames: List[str]):
+        now = datetime.utcnow()
+        await get_database().connection_events.insert_one(
+            {
+                "usernames": usernames,
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=CONNECTION_EVENT_TTL_SECONDS),
+            }
+        )
+
+    async def _watch(self):
+        """Follow inserts, resuming after the last seen event on errors"""
+        resume_token = None
+        pipeline = [
+            {
+                "$match": {
+                    "operationType": "insert",
+                    "ns.coll": {"$in": ["signaling", "connection_events"]},
+                }
+            }
+        ]
+        while True:
+            try:
+                async with get_database().watch(
+                    pipeline, resume_after=resume_token
+                ) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        document = change["fullDocument"]
+                        if change["ns"]["coll"] == "connection_events":
+                            self._dispatch_invalidation(document["usernames"])
+                        else:
+                            await self._dispatch(document)
+            except PyMongoError as e:
+                print(f"Signal change stream error, retrying: {e}")
+                await asyncio.sleep(self.RETRY_SECONDS)
+
+
+def create_signal_bus(backend: str) -> SignalBus:
+    """Build bus from config name"""
+    if backend == "memory":
+        return InProcessSignalBus()
+    if backend == "mongo":
+        return MongoChangeStreamSignalBus()
+    raise ValueError(f"Unknown SIGNAL_BUS backend: {backend}")
+
+
+signal_bus = create_signal_bus(settings.SIGNAL_BUS)
@@ -0,0 +1,48 @@
+"""
+Signal Notifier
+Wakes long-polling requests when a signal arrives for their user
+"""
+
+import asyncio
+from typing import Dict, Set
+
+
+class SignalNotifier:
+    """In-process wake-ups for parked pollers, keyed by recipient username"""
+
+    def __init__(self):
+        self._waiters: Dict[str, Set[asyncio.Event]] = {}
+
+    def register(self, username: str) -> asyncio.Event:
+        """
+        Register interest before checking the store, so a signal
+        arriving between the check and the wait is not missed.
+        """
+        event = asyncio.Event()
+        self._waiters.setdefault(username, set()).add(event)
+        return event
+
+    def unregister(self, username: str, event: asyncio.Event):
+        """Drop a waiter once its request finishes"""
+        waiters = self._waiters.get(username)
+        if not waiters:
+            return
+        waiters.discard(event)
+        if not waiters:
+            del self._waiters[username]
+
+    async def wait(self, event: asyncio.Event, timeout: float) -> bool:
+        """Wait until notified or timeout. Returns True if notified."""
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def notify(self, username: str):
+        """Wake every poller parked for the user"""
+        for event in self._waiters.get(username, ()):
+            event.set()
+
+
+notifier = SignalNotifier()
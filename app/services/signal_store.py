@@ -0,0 +1,456 @@
+"""
+Signal Store
+Where undelivered signals wait for their recipient
+"""
+
+import asyncio
+import math
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from bson import ObjectId
+from app.db.mongodb import get_collection
+from app.config import settings
+
+# (signals, has_more, cursor) - cursor is set only for leased batches
+ClaimResult = Tuple[List[dict], bool, Optional[str]]
+
+
+class SignalStore(ABC):
+    """
+    Storage interface used by signaling_service.
+    Signal documents carry from_user, to_user, type, encrypted_payload,
+    created_at and expires_at, optionally generation and session_id;
+    the store assigns _id.
+    """
+
+    async def start(self):
+        """Start background work (if any)"""
+
+    async def stop(self):
+        """Stop background work (if any)"""
+
+    @abstractmethod
+    async def insert_many(self, signals: List[dict]):
+        """Store signals for offline recipients"""
+
+    @abstractmethod
+    async def claim(
+        self,
+        to_user: str,
+        limit: int,
+        lease_seconds: Optional[int],
+        session_id: Optional[str] = None,
+    ) -> ClaimResult:
+        """
+        Claim up to limit signals, oldest first (only those of one
+        handshake session if session_id is given).
+        The batch is claimed atomically - exclusive to this poll, never
+        also handed to a concurrent poll or a direct push (take).
+        lease_seconds=None deletes it right away (at-most-once).
+        Otherwise it is leased and redelivered unless acked before the
+        lease runs out.
+        """
+
+    @abstractmethod
+    async def ack(self, to_user: str, cursor: str) -> int:
+        """Delete a leased batch"""
+
+    @abstractmethod
+    async def take(self, signal: dict) -> Optional[dict]:
+        """Remove a single signal for direct push; None if already taken"""
+
+    @abstractmethod
+    async def restore(self, signal: dict):
+        """Put back a signal whose push failed"""
+
+    @abstractmethod
+    async def offer_generations(self, to_user: str, senders: List[str]) -> Dict[str, int]:
+        """Newest queued offer generation per sender (senders without one omitted)"""
+
+    @abstractmethod
+    async def purge_session(self, session_id: str, users: Tuple[str, str]) -> int:
+        """Delete the remaining signals of a finished session between users"""
+
+    @abstractmethod
+    async def clear(self, username: str) -> int:
+        """Delete all signals for/from a user"""
+
+
+def _signals():
+    """Signaling collection with fast (w=1) writes"""
+    return get_collection("signaling", "ephemeral")
+
+
+class MongoSignalStore(SignalStore):
+    """Signals in the signaling collection (TTL index, shared by all workers)"""
+
+    # A plain poll's batch is leased this long between claim and delete,
+    # so a poll that dies in between doesn't lose it
+    PLAIN_CLAIM_SECONDS = 30
+
+    async def insert_many(self, signals: List[dict]):
+        await _signals().insert_many(signals)
+
+    async def claim(
+        self,
+        to_user: str,
+        limit: int,
+        lease_seconds: Optional[int],
+        session_id: Optional[str] = None,
+    ) -> ClaimResult:
+        signaling = _signals()
+        now = datetime.utcnow()
+
+        # Skip expired signals (TTL monitor lags) and ones leased to another poll
+        query = {
+            "to_user": to_user,
+            "expires_at": {"$gt": now},
+            "lease_until": {"$not": {"$gt": now}},
+        }
+        if session_id:
+            query["session_id"] = session_id
+        cursor = signaling.find(
+            query,
+            {
+                "_id": 1,
+                "from_user": 1,
+                "type": 1,
+                "encrypted_payload": 1,
+                "generation": 1,
+                "session_id": 1,
+                "created_at": 1,
+            },
+        ).sort([("created_at", 1), ("_id", 1)])  # _id keeps a batch in send order
+
+        signals = await cursor.to_list(length=limit + 1)
+        has_more = len(signals) > limit
+        signals = signals[:limit]
+
+        if not signals:
+            return [], False, None
+
+        signal_ids = [s["_id"] for s in signals]
+        claim_id = uuid.uuid4().hex
+        result = await signaling.update_many(
+            {"_id": {"$in": signal_ids}, "lease_until": {"$not": {"$gt": now}}},
+            {
+                "$set": {
+                    "claim_id": claim_id,
+                    "lease_until": now
+                    + timedelta(seconds=lease_seconds or self.PLAIN_CLAIM_SECONDS),
+                }
+            },
+        )
+
+        if result.modified_count < len(signals):
+            # Lost part of the batch to a concurrent poll - keep what we won
+            won = await signaling.find(
+                {"to_user": to_user, "claim_id": claim_id}, {"_id": 1}
+            ).to_list(length=limit)
+            won_ids = {w["_id"] for w in won}
+            signals = [s for s in signals if s["_id"] in won_ids]
+
+        if lease_seconds is None:
+            # Plain poll: delete only what this claim won
+            await signaling.delete_many({"to_user": to_user, "claim_id": claim_id})
+            return signals, has_more, None
+        return signals, has_more, claim_id
+
+    async def ack(self, to_user: str, cursor: str) -> int:
+        result = await _signals().delete_many(
+            {"to_user": to_user, "claim_id": cursor}
+        )
+        return result.deleted_count
+
+    async def take(self, signal: dict) -> Optional[dict]:
+        # A signal claimed by a poll is that poll's to deliver
+        return await _signals().find_one_and_delete(
+            {"_id": signal["_id"], "lease_until": {"$not": {"$gt": datetime.utcnow()}}}
+        )
+
+    async def restore(self, signal: dict):
+        await _signals().insert_one(signal)
+
+    async def offer_generations(self, to_user: str, senders: List[str]) -> Dict[str, int]:
+        offers = await _signals().find(
+            {
+                "to_user": to_user,
+                "from_user": {"$in": senders},
+                "type": "offer",
+                "expires_at": {"$gt": datetime.utcnow()},
+            },
+            {"_id": 0, "from_user": 1, "generation": 1},
+        ).to_list(length=None)
+        latest: Dict[str, int] = {}
+        for offer in offers:
+            generation = offer.get("generation", 0)
+            latest[offer["from_user"]] = max(generation, latest.get(offer["from_user"], 0))
+        return latest
+
+    async def purge_session(self, session_id: str, users: Tuple[str, str]) -> int:
+        result = await _signals().delete_many(
+            {"session_id": session_id, "to_user": {"$in": list(users)}}
+        )
+        return result.deleted_count
+
+    async def clear(self, username: str) -> int:
+        result = await _signals().delete_many(
+            {"$or": [{"to_user": username}, {"from_user": username}]}
+        )
+        return result.deleted_count
+
+
+class TimingWheel:
+    """
+    Hashed timing wheel - O(1) schedule, each tick only touches one slot.
+    Items further out than one revolution carry a remaining-rounds count.
+    """
+
+    def __init__(self, slots: int, tick_seconds: float):
+        self.tick_seconds = tick_seconds
+        self._slots: List[List[list]] = [[] for _ in range(slots)]
+        self._cursor = 0
+
+    def schedule(self, delay: float, callback: Callable[[], None]):
+        """Run callback on the first tick at least delay seconds from now"""
+        ticks = max(1, math.ceil(delay / self.tick_seconds))
+        slot = (self._cursor + ticks) % len(self._slots)
+        self._slots[slot].append([(ticks - 1) // len(self._slots), callback])
+
+    def advance(self) -> List[Callable[[], None]]:
+        """Move one tick forward and return callbacks that are due"""
+        self._cursor = (self._cursor + 1) % len(self._slots)
+        due, pending = [], []
+        for item in self._slots[self._cursor]:
+            if item[0] == 0:
+                due.append(item[1])
+            else:
+                item[0] -= 1
+                pending.append(item)
+        self._slots[self._cursor] = pending
+        return due
+
+
+class _Entry:
+    """Queued signal; dead entries are skipped and trimmed lazily"""
+
+    __slots__ = ("signal", "dead")
+
+    def __init__(self, signal: dict):
+        self.signal = signal
+        self.dead = False
+
+
+class MemorySignalStore(SignalStore):
+    """
+    In-process broker for single-node deployments - no database I/O.
+    Per-recipient bounded deques (oldest dropped when full), expiry via a
+    hashed timing wheel, plus an exact expires_at check on claim.
+    """
+
+    WHEEL_SLOTS = 512
+
+    def __init__(self, queue_size: int, tick_seconds: float = 1.0):
+        self._queue_size = queue_size
+        self._queues: Dict[str, Deque[_Entry]] = {}
+        self._entries: Dict[ObjectId, _Entry] = {}
+        self._leases: Dict[str, Tuple[str, List[_Entry]]] = {}
+        self._wheel = TimingWheel(self.WHEEL_SLOTS, tick_seconds)
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run_wheel())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run_wheel(self):
+        """Advance one tick per elapsed tick_seconds"""
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self._wheel.tick_seconds
+            await asyncio.sleep(max(0, next_tick - time.monotonic()))
+            for callback in self._wheel.advance():
+                callback()
+
+    def _enqueue(self, entry: _Entry, front: bool = False):
+        to_user = entry.signal["to_user"]
+        self._trim(to_user)
+        queue = self._queues.setdefault(to_user, deque())
+        if len(queue) >= self._queue_size:
+            # Dead entries (taken, expired) don't count toward the cap
+            live = [e for e in queue if not e.dead]
+            if len(live) < len(queue):
+                queue.clear()
+                queue.extend(live)
+        if len(queue) >= self._queue_size:
+            # Bounded - drop the oldest to make room. A front insert puts
+            # back signals older than everything queued, so the newest goes.
+            self._kill(queue.pop() if front else queue.popleft())
+        if front:
+            queue.appendleft(entry)
+        else:
+            queue.append(entry)
+        self._entries[entry.signal["_id"]] = entry
+
+    def _kill(self, entry: _Entry):
+        entry.dead = True
+        self._entries.pop(entry.signal["_id"], None)
+
+    def _trim(self, to_user: str):
+        """Drop dead entries at the head of a queue, and the queue if empty"""
+        queue = self._queues.get(to_user)
+        while queue and queue[0].dead:
+            queue.popleft()
+        if queue is not None and not queue:
+            del self._queues[to_user]
+
+    def _expire(self, entry: _Entry):
+        """Wheel callback - drop entry and trim dead heads of its queue"""
+        self._kill(entry)
+        self._trim(entry.signal["to_user"])
+
+    def _schedule_expiry(self, entry: _Entry):
+        delay = (entry.signal["expires_at"] - datetime.utcnow()).total_seconds()
+        self._wheel.schedule(delay, lambda: self._expire(entry))
+
+    async def insert_many(self, signals: List[dict]):
+        for signal in signals:
+            signal.setdefault("_id", ObjectId())
+            entry = _Entry(signal)
+            self._enqueue(entry)
+            self._schedule_expiry(entry)
+
+    async def claim(
+        self,
+        to_user: str,
+        limit: int,
+        lease_seconds: Optional[int],
+        session_id: Optional[str] = None,
+    ) -> ClaimResult:
+        queue = self._queues.get(to_user)
+        if not queue:
+            return [], False, None
+
+        now = datetime.utcnow()
+        claimed: List[_Entry] = []
+        skipped: List[_Entry] = []  # Other sessions' signals stay queued, in order
+        has_more = False
+        while queue:
+            entry = queue.popleft()
+            if entry.dead:
+                continue
+            if entry.signal["expires_at"] <= now:
+                # Exact expiry - the wheel tick may not have run yet
+                self._kill(entry)
+                continue
+            if session_id and entry.signal.get("session_id") != session_id:
+                skipped.append(entry)
+                continue
+            if len(claimed) == limit:
+                has_more = True
+                queue.appendleft(entry)
+                break
+            self._entries.pop(entry.signal["_id"], None)
+            claimed.append(entry)
+
+        queue.extendleft(reversed(skipped))
+        self._trim(to_user)
+
+        if not claimed or lease_seconds is None:
+            return [e.signal for e in claimed], has_more, None
+
+        claim_id = uuid.uuid4().hex
+        self._leases[claim_id] = (to_user, claimed)
+        self._wheel.schedule(lease_seconds, lambda: self._release(claim_id))
+        return [e.signal for e in claimed], has_more, claim_id
+
+    def _release(self, claim_id: str):
+        """Lease ran out without ack - requeue in original order"""
+        lease = self._leases.pop(claim_id, None)
+        if not lease:
+            return
+        now = datetime.utcnow()
+        for entry in reversed(lease[1]):
+            if entry.signal["expires_at"] > now:
+                self._enqueue(entry, front=True)
+
+    async def ack(self, to_user: str, cursor: str) -> int:
+        lease = self._leases.get(cursor)
+        if not lease or lease[0] != to_user:
+            return 0
+        del self._leases[cursor]
+        return len(lease[1])
+
+    async def take(self, signal: dict) -> Optional[dict]:
+        entry = self._entries.get(signal["_id"])
+        if not entry:
+            return None
+        self._kill(entry)
+        return entry.signal
+
+    async def restore(self, signal: dict):
+        entry = _Entry(signal)
+        self._enqueue(entry, front=True)
+        self._schedule_expiry(entry)
+
+    async def offer_generations(self, to_user: str, senders: List[str]) -> Dict[str, int]:
+        latest: Dict[str, int] = {}
+        for entry in self._queues.get(to_user, ()):
+            signal = entry.signal
+            if entry.dead or signal["type"] != "offer" or signal["from_user"] not in senders:
+                continue
+            generation = signal.get("generation", 0)
+            latest[signal["from_user"]] = max(generation, latest.get(signal["from_user"], 0))
+        return latest
+
+    async def purge_session(self, session_id: str, users: Tuple[str, str]) -> int:
+        count = 0
+        for to_user in users:
+            for entry in self._queues.get(to_user, ()):
+                if not entry.dead and entry.signal.get("session_id") == session_id:
+                    self._kill(entry)
+                    count += 1
+            self._trim(to_user)
+        # Leased ones too - like the Mongo store, whatever their lease state -
+        # or a lapsing lease would redeliver them after the session finished
+        for claim_id, (to_user, entries) in self._leases.items():
+            if to_user in users:
+                kept = [e for e in entries if e.signal.get("session_id") != session_id]
+                count += len(entries) - len(kept)
+                self._leases[claim_id] = (to_user, kept)
+        return count
+
+    async def clear(self, username: str) -> int:
+        count = 0
+        for to_user in list(self._queues):
+            for entry in self._queues[to_user]:
+                if entry.dead:
+                    continue
+                if to_user == username or entry.signal["from_user"] == username:
+                    self._kill(entry)
+                    count += 1
+            self._trim(to_user)
+        return count
+
+
+def create_signal_store(backend: str) -> SignalStore:
+    """Build store from config name"""
+    if backend == "mongo":
+        return MongoSignalStore()
+    if backend == "memory":
+        return MemorySignalStore(settings.SIGNAL_MEMORY_QUEUE_SIZE)
+    raise ValueError(f"Unknown SIGNAL_STORE backend: {backend}")
+
+
+signal_store = create_signal_store(settings.SIGNAL_STORE)
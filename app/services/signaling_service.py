@@ -1,74 +1,346 @@
-from app.db.mongodb import get_database
-from app.schemas.signaling import SignalSendRequest, SignalMessage
+from app.schemas.signaling import SignalSendRequest, SignalMessage, SignalPollResponse
+from app.services.websocket_manager import manager
+from app.services.signal_notifier import notifier
+from app.services.signal_bus import signal_bus
+from app.services.signal_store import signal_store
+from app.services.connection_graph import connection_graph
+from app.services import handshake_service
+from app.utils.metrics import registry
 from app.config import settings
-from datetime import datetime, timedelta
-from typing import List
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+import base64
 
+signal_delivery_delay = registry.histogram(
+    "signal_delivery_delay_seconds",
+    "Time from send to delivery (push = WebSocket, poll = poll or WebSocket backlog)",
+    ("path",),
+)
 
-async def send_signal(from_user: str, req: SignalSendRequest) -> bool:
+
+def _payload_bytes(req: SignalSendRequest) -> bytes:
+    """Payload as stored (BSON binary); the schema already decoded base64"""
+    if isinstance(req.encrypted_payload, bytes):
+        return req.encrypted_payload
+    return req.encrypted_payload.encode()
+
+
+def _epoch_ms(dt: datetime) -> int:
+    """Naive UTC datetime -> epoch milliseconds"""
+    return int(dt.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def _encode_payloads(payloads: List[bytes], binary: bool) -> Tuple[list, Optional[str]]:
+    """
+    Raw bytes for MessagePack/CBOR. For JSON: text when every payload is
+    UTF-8, otherwise all of them base64 (with encoding="base64").
+    """
+    if binary:
+        return payloads, None
+    try:
+        return [payload.decode() for payload in payloads], None
+    except UnicodeDecodeError:
+        return [base64.b64encode(payload).decode() for payload in payloads], "base64"
+
+
+def _to_message(
+    signal: dict, binary: bool = False, group: Optional[List[dict]] = None
+) -> SignalMessage:
+    """
+    Convert stored signal document to client-facing message.
+    binary=True (MessagePack/CBOR): raw payload bytes, epoch-ms timestamp.
+    group: coalesced ICE signals starting with this one - the payload
+    becomes the list of their payloads, in order.
+    """
+    raw = []
+    for s in group or [signal]:
+        payload = s["encrypted_payload"]
+        # Signals stored before payloads were bytes hold strings
+        raw.append(payload.encode() if isinstance(payload, str) else payload)
+    payloads, encoding = _encode_payloads(raw, binary)
+
+    created_at = signal["created_at"]
+    return SignalMessage(
+        from_user=signal["from_user"],
+        type=signal["type"],
+        encrypted_payload=payloads if group else payloads[0],
+        encoding=encoding,
+        generation=signal.get("generation"),
+        session_id=signal.get("session_id"),
+        timestamp=_epoch_ms(created_at) if binary else created_at.isoformat(),
+    )
+
+
+def _generation(signal: dict) -> int:
+    """Negotiation generation; untagged signals count by send time, like offers"""
+    generation = signal.get("generation")
+    return generation if generation is not None else _epoch_ms(signal["created_at"])
+
+
+def _drop_superseded(signals: List[dict], queued_offers: Dict[str, int]) -> List[dict]:
     """
-    Store signaling message for recipient.
+    Drop signals older than the sender's current generation - the newest
+    of its offers and tagged signals in this batch, and of queued_offers
+    (its newest offer still queued past this batch). Stragglers of a
+    restarted negotiation never reach the client, wherever the batch
+    boundary falls and whether or not they were tagged.
+    """
+    latest = dict(queued_offers)
+    for signal in signals:
+        if signal["type"] == "offer" or signal.get("generation") is not None:
+            sender = signal["from_user"]
+            latest[sender] = max(_generation(signal), latest.get(sender, 0))
+    return [s for s in signals if _generation(s) >= latest.get(s["from_user"], 0)]
+
+
+def _coalesce(signals: List[dict], binary: bool) -> List[SignalMessage]:
+    """
+    One ICE message per (sender, generation), placed where its first
+    candidate was; other signals unchanged, order kept.
+    """
+    slots: List[Tuple[dict, Optional[List[dict]]]] = []
+    groups: Dict[Tuple[str, Optional[int]], List[dict]] = {}
+    for signal in signals:
+        if signal["type"] != "ice":
+            slots.append((signal, None))
+            continue
+        key = (signal["from_user"], signal.get("generation"))
+        if key in groups:
+            groups[key].append(signal)
+        else:
+            groups[key] = [signal]
+            slots.append((signal, groups[key]))
+    return [_to_message(signal, binary, group) for signal, group in slots]
+
+
+def _observe_delivery(signals: List[dict], path: str):
+    """Record send-to-delivery delay for delivered signals"""
+    now = datetime.utcnow()
+    for signal in signals:
+        signal_delivery_delay.observe((now - signal["created_at"]).total_seconds(), path=path)
+
+
+async def send_signal(from_user: str, req: SignalSendRequest) -> Optional[int]:
+    """
+    Deliver signaling message to recipient.
+    - Pushed straight to the recipient's WebSocket if connected
+    - Otherwise stored until polled (or TTL expiry)
     Server CANNOT read encrypted_payload - it's PGP encrypted by client.
+    Returns the signal's negotiation generation (see send_signals).
+    """
+    generations = await send_signals(from_user, [req])
+    return generations[0]
+
+
+async def send_signals(from_user: str, reqs: List[SignalSendRequest]) -> List[Optional[int]]:
+    """
+    Deliver a batch of signals (e.g. a trickle-ICE burst), possibly to
+    several recipients. Offline recipients' signals are stored with one
+    bulk write sharing a single created_at / expires_at.
+
+    An offer starts a new negotiation generation for its pair (its
+    epoch-ms send time). Answers and ICE carry the generation the client
+    echoes from the offer. Nothing is deleted here: polls drop what the
+    sender queued for an older generation (see _drop_superseded), so a
+    send stays one write and never races a poll.
+
+    A signal tagged with a handshake session must name an open session
+    between sender and recipient; offers and answers move it to
+    offered / answered (only the invited peer answers). A rejected batch
+    leaves every session as it was.
+
+    Returns each signal's generation.
+    Raises ValueError (nothing sent) if any recipient isn't a connection,
+    or a session is unknown or doesn't accept the offer/answer.
     """
-    db = get_database()
+    created_at = datetime.utcnow()
+    expires_at = created_at + timedelta(seconds=settings.SIGNAL_EXPIRE_SECONDS)
+    offer_generation = _epoch_ms(created_at)
 
-    # Normalize recipient username
-    to_user = req.to_user
-    if not to_user.startswith("@"):
-        to_user = f"@{to_user}"
-    to_user = to_user.lower()
+    # Normalize recipient usernames
+    recipients = []
+    for req in reqs:
+        to_user = req.to_user
+        if not to_user.startswith("@"):
+            to_user = f"@{to_user}"
+        recipients.append(to_user.lower())
 
-    # Create signal document with TTL
-    signal_doc = {
-        "from_user": from_user,
-        "to_user": to_user,
-        "type": req.type,
-        "encrypted_payload": req.encrypted_payload,  # Server can't read this
-        "created_at": datetime.utcnow(),
-        "expires_at": datetime.utcnow()
-        + timedelta(seconds=settings.SIGNAL_EXPIRE_SECONDS),
-    }
+    if settings.SIGNAL_REQUIRE_CONNECTION:
+        for to_user in set(recipients):
+            if not await connection_graph.are_connected(from_user, to_user):
+                raise ValueError(f"Not connected to {to_user}")
 
-    await db.signaling.insert_one(signal_doc)
-    return True
+    tagged = [
+        (to_user, req.session_id, req.type)
+        for req, to_user in zip(reqs, recipients)
+        if req.session_id
+    ]
+    if tagged:
+        await handshake_service.advance_for_signals(from_user, tagged)
+
+    # Last offer per recipient - anything before it in this batch is already stale
+    last_offer = {}
+    for i, (req, to_user) in enumerate(zip(reqs, recipients)):
+        if req.type == "offer":
+            last_offer[to_user] = i
+
+    generations = []
+    to_store = []
+    for i, (req, to_user) in enumerate(zip(reqs, recipients)):
+        generation = offer_generation if req.type == "offer" else req.generation
+        generations.append(generation)
+        if i < last_offer.get(to_user, -1):
+            continue
+
+        # Create signal document with TTL
+        signal_doc = {
+            "from_user": from_user,
+            "to_user": to_user,
+            "type": req.type,
+            "encrypted_payload": _payload_bytes(req),  # Server can't read this
+            "created_at": created_at,
+            "expires_at": expires_at,
+        }
+        if generation is not None:
+            signal_doc["generation"] = generation
+        if req.session_id:
+            signal_doc["session_id"] = req.session_id
+
+        # Recipient online over WebSocket - skip the database entirely
+        if await manager.send(to_user, _to_message(signal_doc).model_dump(exclude_none=True)):
+            _observe_delivery([signal_doc], "push")
+            continue
+        to_store.append(signal_doc)
+
+    if to_store:
+        await signal_store.insert_many(to_store)
+        # Recipients may be connected to (or long-polling) another worker
+        for signal_doc in to_store:
+            await signal_bus.publish(signal_doc)
+
+    return generations
+
+
+async def _route_signal(signal: dict):
+    """
+    Bus handler - runs on every worker for each stored signal.
+    Pushes to a local WebSocket if the recipient has one here,
+    otherwise wakes local long-pollers.
+    """
+    to_user = signal["to_user"]
+
+    if manager.is_connected(to_user):
+        # Claim first so no other worker / poller delivers it twice
+        claimed = await signal_store.take(signal)
+        if not claimed:
+            return
+        if await manager.send(to_user, _to_message(claimed).model_dump(exclude_none=True)):
+            _observe_delivery([claimed], "push")
+            return
+        # Socket died in the meantime - put it back for polling
+        await signal_store.restore(claimed)
+
+    notifier.notify(to_user)
+
+
+async def start():
+    """
+    Start the signal store and subscribe this worker to the fan-out bus
+    (signals, and connection changes for the connection graph cache)
+    """
+    if settings.SIGNAL_STORE == "memory" and settings.SIGNAL_BUS == "mongo":
+        raise ValueError("SIGNAL_BUS=mongo requires SIGNAL_STORE=mongo")
+    await signal_store.start()
+    await signal_bus.start(_route_signal, on_invalidate=connection_graph.invalidate)
 
 
-async def poll_signals(username: str) -> List[SignalMessage]:
+async def stop():
+    """Unsubscribe from the fan-out bus and stop the signal store"""
+    await signal_bus.stop()
+    await signal_store.stop()
+
+
+async def poll_signals(
+    username: str,
+    wait: float = 0,
+    ack: Optional[str] = None,
+    lease: bool = False,
+    binary: bool = False,
+    coalesce: bool = False,
+    session_id: Optional[str] = None,
+) -> SignalPollResponse:
     """
-    Get pending signals for user and delete them.
+    Claim the next batch of pending signals for user.
     Returns PGP-encrypted payloads that only the client can decrypt.
+
+    - ack: cursor of a previously leased batch - deleted in bulk first
+    - lease=False: claimed batch is deleted right away (at-most-once)
+    - lease=True: batch is only leased; it is redelivered unless acked
+      before SIGNAL_LEASE_SECONDS, and its cursor is returned
+    - has_more tells the client to poll again immediately
+    - binary: messages for a MessagePack/CBOR response (see _to_message)
+    - coalesce: pending ICE per sender and generation comes as one message
+      whose encrypted_payload is a list
+    - session_id: only signals of that handshake session
+    Signals a sender queued for an older generation than its newest
+    queued offer are dropped.
+
+    With wait > 0 (long-poll), an empty result parks the request until
+    send_signal notifies this user or the timeout passes.
     """
-    db = get_database()
-
-    # Find all pending signals for this user
-    cursor = db.signaling.find(
-        {"to_user": username},
-        {"_id": 1, "from_user": 1, "type": 1, "encrypted_payload": 1, "created_at": 1},
-    ).sort("created_at", 1)
-
-    signals = await cursor.to_list(length=100)
-
-    if signals:
-        # Delete fetched signals
-        signal_ids = [s["_id"] for s in signals]
-        await db.signaling.delete_many({"_id": {"$in": signal_ids}})
-
-    return [
-        SignalMessage(
-            from_user=s["from_user"],
-            type=s["type"],
-            encrypted_payload=s["encrypted_payload"],
-            timestamp=s["created_at"].isoformat(),
-        )
-        for s in signals
-    ]
+    if ack:
+        await ack_signals(username, ack)
 
+    if wait <= 0:
+        return await _claim_signals(username, lease, binary, coalesce, session_id)
 
-async def clear_signals(username: str) -> int:
-    """Clear all pending signals for/from a user"""
-    db = get_database()
+    event = notifier.register(username)
+    try:
+        result = await _claim_signals(username, lease, binary, coalesce, session_id)
+        if not result.messages and await notifier.wait(event, wait):
+            result = await _claim_signals(username, lease, binary, coalesce, session_id)
+        return result
+    finally:
+        notifier.unregister(username, event)
 
-    result = await db.signaling.delete_many(
-        {"$or": [{"to_user": username}, {"from_user": username}]}
+
+async def _claim_signals(
+    username: str, lease: bool, binary: bool, coalesce: bool, session_id: Optional[str]
+) -> SignalPollResponse:
+    """
+    Claim up to SIGNAL_POLL_BATCH_SIZE signals.
+    Leased batches are exclusive: concurrent polls of the same user
+    never receive the same leased signal.
+    """
+    signals, has_more, cursor = await signal_store.claim(
+        username,
+        settings.SIGNAL_POLL_BATCH_SIZE,
+        settings.SIGNAL_LEASE_SECONDS if lease else None,
+        session_id,
+    )
+    queued_offers = {}
+    if has_more:
+        # The batch was cut - the sender's newest offer may be past it
+        senders = list({s["from_user"] for s in signals})
+        queued_offers = await signal_store.offer_generations(username, senders)
+    signals = _drop_superseded(signals, queued_offers)
+    _observe_delivery(signals, "poll")
+    if coalesce:
+        messages = _coalesce(signals, binary)
+    else:
+        messages = [_to_message(s, binary) for s in signals]
+    return SignalPollResponse(
+        messages=messages,
+        has_more=has_more,
+        cursor=cursor,
     )
-    return result.deleted_count
+
+
+async def ack_signals(username: str, cursor: str) -> int:
+    """Delete a claimed batch in bulk once the client has it"""
+    return await signal_store.ack(username, cursor)
+
+
+async def clear_signals(username: str) -> int:
+    """Clear all pending signals for/from a user"""
+    return await signal_store.clear(username)
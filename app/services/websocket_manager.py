@@ -0,0 +1,71 @@
+"""
+WebSocket Manager
+Registry of live signaling sockets, keyed by username
+"""
+
+from fastapi import WebSocket
+from typing import Dict, List, Set
+
+
+class ConnectionManager:
+    """
+    Tracks open signaling WebSockets for users connected to this worker.
+    A new socket first gets the user's stored backlog; pushes meanwhile
+    are held back and sent after it (flush), so e.g. ICE never overtakes
+    its queued offer.
+    """
+
+    def __init__(self):
+        self._sockets: Dict[str, Set[WebSocket]] = {}
+        self._held: Dict[WebSocket, List[dict]] = {}
+
+    async def connect(self, username: str, websocket: WebSocket):
+        """Accept a socket and register it for the user, holding pushes back"""
+        await websocket.accept()
+        self._held[websocket] = []
+        self._sockets.setdefault(username, set()).add(websocket)
+
+    async def flush(self, websocket: WebSocket):
+        """Backlog sent - send the held-back pushes in order and go live"""
+        held = self._held.get(websocket, [])
+        while held:
+            await websocket.send_json(held.pop(0))
+        # No await since the last check - nothing can slip in between
+        self._held.pop(websocket, None)
+
+    def disconnect(self, username: str, websocket: WebSocket):
+        """Forget a socket (closed or broken)"""
+        self._held.pop(websocket, None)
+        sockets = self._sockets.get(username)
+        if not sockets:
+            return
+        sockets.discard(websocket)
+        if not sockets:
+            del self._sockets[username]
+
+    def is_connected(self, username: str) -> bool:
+        """Whether the user has at least one live socket on this worker"""
+        return username in self._sockets
+
+    async def send(self, username: str, message: dict) -> bool:
+        """
+        Push a message to every socket of the user.
+        Returns True if at least one socket received it.
+        """
+        delivered = False
+        for websocket in list(self._sockets.get(username, ())):
+            held = self._held.get(websocket)
+            if held is not None:
+                held.append(message)
+                delivered = True
+                continue
+            try:
+                await websocket.send_json(message)
+                delivered = True
+            except Exception:
+                # Socket went away mid-send - drop it, the reader loop will exit
+                self.disconnect(username, websocket)
+        return delivered
+
+
+manager = ConnectionManager()
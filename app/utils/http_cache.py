@@ -0,0 +1,29 @@
+"""
+HTTP Caching Helpers
+ETag / If-None-Match support for responses clients tend to re-fetch
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, Optional
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+
+def conditional_json(
+    request: Request, content: Any, headers: Optional[Dict[str, str]] = None
+) -> Response:
+    """
+    JSON response with a strong ETag over the body.
+    Returns 304 with no body when the client's If-None-Match matches.
+    """
+    body = json.dumps(jsonable_encoder(content), separators=(",", ":")).encode()
+    etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+    headers = {**(headers or {}), "ETag": etag}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    if etag in candidates or "*" in candidates:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
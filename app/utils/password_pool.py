@@ -0,0 +1,117 @@
+"""
+Password Hashing Pool
+Runs Argon2 off the event loop on a bounded process pool
+"""
+
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+from fastapi import HTTPException, status
+from app.config import settings
+from app.utils.security import hash_password, verify_password
+
+
+def _timed(fn: Callable, *args) -> Tuple[Any, float, float]:
+    """Runs in the worker process - returns (result, start wall time, duration)"""
+    started = time.time()
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, started, time.perf_counter() - t0
+
+
+class PasswordHashPool:
+    """
+    Process pool with admission control.
+    At most workers + queue_size jobs are in flight; beyond that callers
+    get 503 with Retry-After instead of queueing without bound.
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = self.workers + queue_size
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        # Measurements (seconds)
+        self.completed = 0
+        self.rejected = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.hash_time_total = 0.0
+        self.hash_time_max = 0.0
+
+    def start(self):
+        if self._executor is None:
+            # Never fork: by now Motor's monitor threads exist, and a forked
+            # copy of a threaded process can deadlock on a lock they held
+            method = "forkserver"
+            if method not in multiprocessing.get_all_start_methods():
+                method = "spawn"
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context(method)
+            )
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Run fn(*args) in the pool, or reject with 503 when saturated"""
+        if self._pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, please retry",
+                headers={"Retry-After": str(settings.PASSWORD_HASH_RETRY_AFTER_SECONDS)},
+            )
+
+        self.start()
+        self._pending += 1
+        submitted = time.time()
+        try:
+            result, started, duration = await asyncio.get_running_loop().run_in_executor(
+                self._executor, _timed, fn, *args
+            )
+        finally:
+            self._pending -= 1
+
+        queue_wait = max(0.0, started - submitted)
+        self.completed += 1
+        self.queue_wait_total += queue_wait
+        self.queue_wait_max = max(self.queue_wait_max, queue_wait)
+        self.hash_time_total += duration
+        self.hash_time_max = max(self.hash_time_max, duration)
+        return result
+
+    def stats(self) -> dict:
+        """Snapshot of pool load and timings"""
+        completed = self.completed or 1
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self._pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "queue_wait_avg_ms": round(self.queue_wait_total / completed * 1000, 3),
+            "queue_wait_max_ms": round(self.queue_wait_max * 1000, 3),
+            "hash_time_avg_ms": round(self.hash_time_total / completed * 1000, 3),
+            "hash_time_max_ms": round(self.hash_time_max * 1000, 3),
+        }
+
+
+password_pool = PasswordHashPool(
+    settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE_SIZE
+)
+
+
+async def hash_password_async(password: str) -> str:
+    """Argon2 hash without blocking the event loop"""
+    return await password_pool.run(hash_password, password)
+
+
+async def verify_password_async(plain: str, hashed: str) -> bool:
+    """Argon2 verify without blocking the event loop"""
+    return await password_pool.run(verify_password, plain, hashed)
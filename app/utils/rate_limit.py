@@ -0,0 +1,178 @@
+"""
+Rate Limiting
+In-memory token buckets per route class, keyed by user or client IP.
+Decisions never touch MongoDB.
+"""
+
+import ipaddress
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, List
+from fastapi import Depends, HTTPException, Request, status
+from app.config import settings
+from app.utils.security import get_current_user
+
+
+class RateLimiter:
+    """
+    Token buckets (rate per second, burst capacity) split over shards by
+    key hash. Each shard is ordered by last use, so idle buckets - which
+    have refilled to full anyway - are dropped from the front in O(1)
+    each, and only the shard being hit is cleaned.
+
+    Only buckets back at full capacity are ever forgotten, so cycling
+    through many keys can't reset anyone's limit. When a shard is full of
+    active buckets, new keys hashed to it share that shard's overflow
+    bucket until room frees up - a flood confined to some shards leaves
+    new clients of the others unaffected.
+    """
+
+    def __init__(self, rate: float, burst: int, shards: int, idle_seconds: float, max_keys: int):
+        self.rate = rate
+        self.burst = burst
+        # A bucket idle this long is full again, so forgetting it is lossless
+        self.idle_seconds = max(idle_seconds, burst / rate)
+        self.max_keys_per_shard = max(1, max_keys // shards)
+        self._shards: List["OrderedDict[str, List[float]]"] = [
+            OrderedDict() for _ in range(shards)
+        ]
+        self._overflow = [[float(burst), time.monotonic()] for _ in range(shards)]
+        self.allowed = 0
+        self.rejected = 0
+        self.overflowed = 0
+
+    def _refilled(self, bucket: List[float], now: float) -> float:
+        return min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+
+    def _evict(self, shard: "OrderedDict[str, List[float]]", now: float):
+        while shard:
+            _, bucket = next(iter(shard.items()))
+            idle = now - bucket[1] >= self.idle_seconds
+            # Over the cap, a least recently used bucket may go once it's full
+            full = len(shard) >= self.max_keys_per_shard and (
+                self._refilled(bucket, now) >= self.burst
+            )
+            if not (idle or full):
+                break
+            shard.popitem(last=False)
+
+    def hit(self, key: str, cost: float = 1) -> float:
+        """Take `cost` tokens. Returns 0 if allowed, else seconds until it would be"""
+        now = time.monotonic()
+        index = hash(key) % len(self._shards)
+        shard = self._shards[index]
+        self._evict(shard, now)
+
+        bucket = shard.get(key)
+        if bucket is not None:
+            shard.move_to_end(key)
+        elif len(shard) < self.max_keys_per_shard:
+            bucket = shard[key] = [float(self.burst), now]
+        else:
+            # Every bucket in the shard is still active - share its overflow one
+            self.overflowed += 1
+            bucket = self._overflow[index]
+        bucket[0] = self._refilled(bucket, now)
+        bucket[1] = now
+
+        if bucket[0] >= cost:
+            bucket[0] -= cost
+            self.allowed += 1
+            return 0.0
+        self.rejected += 1
+        return (cost - bucket[0]) / self.rate
+
+    def check(self, key: str, cost: float = 1):
+        """Raise 429 with Retry-After when the key is over its limit"""
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        retry_after = self.hit(key, cost)
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+    def stats(self) -> dict:
+        return {
+            "keys": sum(len(shard) for shard in self._shards),
+            "allowed": self.allowed,
+            "rejected": self.rejected,
+            "overflowed": self.overflowed,
+        }
+
+
+def _limiter(per_minute: int, burst: int) -> RateLimiter:
+    return RateLimiter(
+        per_minute / 60,
+        burst,
+        settings.RATE_LIMIT_SHARDS,
+        settings.RATE_LIMIT_IDLE_SECONDS,
+        settings.RATE_LIMIT_MAX_KEYS,
+    )
+
+
+# One limiter per route class
+rate_limiters: Dict[str, RateLimiter] = {
+    # login / register - Argon2 per request, keyed by client IP
+    "auth": _limiter(settings.RATE_LIMIT_AUTH_PER_MINUTE, settings.RATE_LIMIT_AUTH_BURST),
+    # forgot / reset password - OTP writes (and later emails), keyed by client IP
+    "password_reset": _limiter(
+        settings.RATE_LIMIT_PASSWORD_RESET_PER_MINUTE, settings.RATE_LIMIT_PASSWORD_RESET_BURST
+    ),
+    # signals sent (HTTP or WebSocket), keyed by sender
+    "signal": _limiter(settings.RATE_LIMIT_SIGNAL_PER_MINUTE, settings.RATE_LIMIT_SIGNAL_BURST),
+}
+
+
+def client_ip(request: Request) -> str:
+    """
+    Client address. Behind a trusted reverse proxy, the last
+    X-Forwarded-For hop (added by the proxy itself, so not spoofable).
+    """
+    if settings.RATE_LIMIT_TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def ip_key(address: str) -> str:
+    """
+    Bucket key for a client address. IPv6 clients are grouped by
+    RATE_LIMIT_IPV6_PREFIX (a /64 is one subscriber), so rotating through
+    their own addresses neither dodges the limit nor floods the limiter.
+    """
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return address
+    if ip.version == 6:
+        if ip.ipv4_mapped:
+            return str(ip.ipv4_mapped)
+        return str(
+            ipaddress.ip_network(f"{ip}/{settings.RATE_LIMIT_IPV6_PREFIX}", strict=False)
+        )
+    return str(ip)
+
+
+def limit_by_ip(route_class: str):
+    """Dependency: one request against the client IP's (or IPv6 prefix's) bucket"""
+    limiter = rate_limiters[route_class]
+
+    async def dependency(request: Request):
+        limiter.check(ip_key(client_ip(request)))
+
+    return dependency
+
+
+def limit_by_user(route_class: str):
+    """Dependency: one request against the authenticated user's bucket"""
+    limiter = rate_limiters[route_class]
+
+    async def dependency(current_user: str = Depends(get_current_user)):
+        limiter.check(current_user)
+
+    return dependency
@@ -5,8 +5,13 @@ from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from cryptography.fernet import Fernet
 from app.config import settings
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Optional, Tuple
 import base64
 import hashlib
+import hmac
+import time
 
 
 # Password hashing with Argon2
@@ -34,14 +39,68 @@ def create_access_token(data: dict) -> str:
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
 
+class TokenCache:
+    """
+    Bounded LRU of already-verified JWT payloads.
+    Keyed by SHA-256 of the raw token; an entry never outlives the
+    token's own exp claim.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: int):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[bytes, Tuple[dict, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[dict]:
+        key = self._key(token)
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, token: str, payload: dict):
+        if self.max_size <= 0:
+            return
+        expires_at = time.time() + self.ttl_seconds
+        if "exp" in payload:
+            expires_at = min(expires_at, float(payload["exp"]))
+        key = self._key(token)
+        self._entries[key] = (payload, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL_SECONDS)
+
+
 def decode_token(token: str) -> dict:
-    """Decode and validate JWT token"""
+    """Decode and validate JWT token (verified tokens are cached)"""
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
     try:
-        return jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid or expired token"
         )
+    token_cache.put(token, payload)
+    return payload
 
 
 async def get_current_user(
@@ -56,12 +115,30 @@ async def get_current_user(
 
 
 # Email encryption (server-side AES)
+@lru_cache(maxsize=1)
 def _get_fernet() -> Fernet:
-    """Get Fernet instance for email encryption"""
+    """Get Fernet instance for email encryption (built once per process)"""
     key = hashlib.sha256(settings.EMAIL_ENCRYPTION_KEY.encode()).digest()
     return Fernet(base64.urlsafe_b64encode(key))
 
 
+@lru_cache(maxsize=1)
+def _get_email_index_key() -> bytes:
+    """HMAC key for the email blind index (separate from the encryption key)"""
+    secret = settings.EMAIL_INDEX_KEY or settings.EMAIL_ENCRYPTION_KEY
+    return hashlib.sha256(b"email-blind-index:" + secret.encode()).digest()
+
+
+def email_blind_index(email: str) -> str:
+    """
+    Deterministic lookup token for an email.
+    Fernet output is randomized, so encrypted emails can't be queried -
+    this HMAC can, without revealing the address.
+    """
+    normalized = email.strip().lower().encode()
+    return hmac.new(_get_email_index_key(), normalized, hashlib.sha256).hexdigest()
+
+
 def encrypt_email(email: str) -> str:
     """Encrypt email for server storage"""
     return _get_fernet().encrypt(email.encode()).decode()
@@ -70,3 +147,11 @@ def encrypt_email(email: str) -> str:
 def decrypt_email(encrypted: str) -> str:
     """Decrypt email (rarely needed)"""
     return _get_fernet().decrypt(encrypted.encode()).decode()
+
+
+def pgp_key_fingerprint(public_key: str) -> str:
+    """
+    Stable fingerprint of an armored public key.
+    Lets clients skip re-downloading keys they already have.
+    """
+    return hashlib.sha256(public_key.strip().encode()).hexdigest()
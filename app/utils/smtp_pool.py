@@ -0,0 +1,122 @@
+"""
+SMTP Pool
+Reusable smtplib connections for the email outbox. smtplib blocks,
+so batches are sent from a worker thread, never on the event loop.
+"""
+
+import queue
+import smtplib
+import ssl
+from email.message import EmailMessage
+from typing import List, Optional, Tuple
+from app.config import settings
+
+# (error or None if sent, permanent - retrying won't help)
+SendResult = Tuple[Optional[str], bool]
+
+
+class SMTPPool:
+    """
+    Up to `size` idle connections, most recently used first. An idle
+    connection is checked with NOOP before reuse, since servers drop
+    quiet clients after a while.
+    """
+
+    def __init__(self, size: int):
+        self._idle: "queue.LifoQueue[smtplib.SMTP]" = queue.LifoQueue(maxsize=size)
+        self.opened = 0
+        self.reused = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        timeout = settings.SMTP_TIMEOUT_SECONDS
+        if settings.SMTP_SSL:
+            conn = smtplib.SMTP_SSL(
+                settings.SMTP_HOST,
+                settings.SMTP_PORT,
+                timeout=timeout,
+                context=ssl.create_default_context(),
+            )
+        else:
+            conn = smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT, timeout=timeout)
+            if settings.SMTP_STARTTLS:
+                conn.starttls(context=ssl.create_default_context())
+        if settings.SMTP_USERNAME:
+            conn.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
+        self.opened += 1
+        return conn
+
+    def _close(self, conn: smtplib.SMTP):
+        try:
+            conn.quit()
+        except (smtplib.SMTPException, OSError):
+            conn.close()
+
+    def _acquire(self) -> smtplib.SMTP:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            try:
+                if conn.noop()[0] == 250:
+                    self.reused += 1
+                    return conn
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._close(conn)
+
+    def _release(self, conn: smtplib.SMTP):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            self._close(conn)
+
+    def send_batch(self, messages: List[EmailMessage]) -> List[SendResult]:
+        """
+        Blocking - run in a thread. Sends the batch over one connection
+        and returns a result per message. If the connection breaks, the
+        rest of the batch is reported as a (retryable) failure.
+        """
+        try:
+            conn = self._acquire()
+        except (smtplib.SMTPException, OSError) as e:
+            return [(f"connect: {e}", False)] * len(messages)
+
+        results: List[SendResult] = []
+        for index, message in enumerate(messages):
+            # SMTPException subclasses OSError - server replies must be
+            # handled before the broken-connection case
+            try:
+                conn.send_message(message)
+            except smtplib.SMTPRecipientsRefused as e:
+                codes = [code for code, _ in e.recipients.values()]
+                results.append((str(e), all(code >= 500 for code in codes)))
+            except smtplib.SMTPResponseException as e:
+                results.append((f"{e.smtp_code} {e.smtp_error!r}", e.smtp_code >= 500))
+            except smtplib.SMTPServerDisconnected as e:
+                conn.close()
+                return results + [(str(e), False)] * (len(messages) - index)
+            except smtplib.SMTPException as e:
+                results.append((str(e), False))
+            except OSError as e:
+                conn.close()
+                return results + [(str(e), False)] * (len(messages) - index)
+            else:
+                results.append((None, False))
+        self._release(conn)
+        return results
+
+    def close(self):
+        """Blocking - close every idle connection"""
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+    def stats(self) -> dict:
+        return {
+            "connections_opened": self.opened,
+            "connections_reused": self.reused,
+            "connections_idle": self._idle.qsize(),
+        }
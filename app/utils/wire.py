@@ -0,0 +1,154 @@
+"""
+Wire Formats
+Content negotiation between JSON and the optional binary codecs:
+MessagePack (pip install msgpack) and CBOR (pip install cbor2).
+Binary bodies carry encrypted payloads as raw bytes - no base64.
+"""
+
+from functools import lru_cache
+from typing import Any, Callable, NamedTuple, Optional, Type
+from fastapi import HTTPException, Request, Response, status
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+
+JSON = "application/json"
+
+
+class Codec(NamedTuple):
+    media_type: str
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[bytes], Any]
+
+
+def _msgpack(media_type: str) -> Codec:
+    import msgpack
+
+    return Codec(
+        media_type,
+        lambda obj: msgpack.packb(obj, use_bin_type=True),
+        lambda data: msgpack.unpackb(data, raw=False),
+    )
+
+
+def _cbor(media_type: str) -> Codec:
+    import cbor2
+
+    return Codec(media_type, cbor2.dumps, cbor2.loads)
+
+
+_LOADERS = {
+    "application/msgpack": _msgpack,
+    "application/x-msgpack": _msgpack,
+    "application/vnd.msgpack": _msgpack,
+    "application/cbor": _cbor,
+}
+
+
+@lru_cache(maxsize=None)
+def get_codec(media_type: str) -> Optional[Codec]:
+    """Binary codec for a media type; None if unknown or its package isn't installed"""
+    loader = _LOADERS.get(media_type)
+    if loader is None:
+        return None
+    try:
+        return loader(media_type)
+    except ImportError:
+        return None
+
+
+def _media_type(value: str) -> str:
+    return value.split(";", 1)[0].strip().lower()
+
+
+def request_codec(request: Request) -> Optional[Codec]:
+    """Codec for the request body - None means JSON. 415 if unsupported."""
+    media_type = _media_type(request.headers.get("content-type", JSON))
+    if media_type in (JSON, ""):
+        return None
+    codec = get_codec(media_type)
+    if codec is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported Content-Type: {media_type}",
+        )
+    return codec
+
+
+def response_codec(request: Request) -> Optional[Codec]:
+    """Preferred available binary codec from Accept - None means JSON"""
+    candidates = []
+    for position, item in enumerate(request.headers.get("accept", "").split(",")):
+        media_type, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            candidates.append((-quality, position, _media_type(media_type)))
+
+    for _, _, media_type in sorted(candidates):
+        if media_type == JSON or media_type.endswith("/*"):
+            return None
+        codec = get_codec(media_type)
+        if codec is not None:
+            return codec
+    return None
+
+
+def body(model: Type[BaseModel]):
+    """
+    Dependency parsing the request body into `model` from JSON or a
+    binary codec (by Content-Type). Validation errors are 422 as usual.
+    """
+
+    async def dependency(request: Request) -> BaseModel:
+        codec = request_codec(request)
+        raw = await request.body()
+        try:
+            if codec is None:
+                return model.model_validate_json(raw)
+            try:
+                data = codec.loads(raw)
+            except Exception:
+                raise HTTPException(status_code=400, detail=f"Malformed {codec.media_type} body")
+            return model.model_validate(data)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+
+    return dependency
+
+
+def _inline_refs(schema: Any, defs: dict) -> Any:
+    if isinstance(schema, dict):
+        if "$ref" in schema:
+            return _inline_refs(defs[schema["$ref"].rsplit("/", 1)[-1]], defs)
+        return {key: _inline_refs(value, defs) for key, value in schema.items()}
+    if isinstance(schema, list):
+        return [_inline_refs(item, defs) for item in schema]
+    return schema
+
+
+def openapi_body(model: Type[BaseModel]) -> dict:
+    """openapi_extra documenting a wire.body() request body in every format"""
+    schema = model.model_json_schema()
+    schema = _inline_refs(schema, schema.pop("$defs", {}))
+    media_types = [JSON] + [m for m in _LOADERS if m != "application/x-msgpack"]
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {media_type: {"schema": schema} for media_type in media_types},
+        }
+    }
+
+
+def encode(codec: Codec, content: BaseModel) -> Response:
+    """Response in a binary format (unset optional fields left out)"""
+    return Response(
+        content=codec.dumps(content.model_dump(exclude_none=True)),
+        media_type=codec.media_type,
+        headers={"Vary": "Accept"},
+    )
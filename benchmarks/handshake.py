@@ -0,0 +1,308 @@
+"""
+Handshake Benchmark
+Drives N client pairs through the full flow against the ASGI app in
+this process (one worker, no network):
+
+    register -> login -> connection request -> accept
+    -> offer -> answer -> trickle ICE (send + poll)
+
+and reports throughput and p50/p95/p99 per step and per handshake.
+Results are written as JSON (tagged with the git commit) so runs can
+be compared between commits.
+
+Usage:
+    python -m benchmarks.handshake --pairs 200 --concurrency 50
+    python -m benchmarks.handshake --in-memory          # needs mongomock-motor
+    python -m benchmarks.handshake --compare benchmarks/results/<old>.json
+
+Against a real mongod (MONGODB_URL) a scratch database
+<DATABASE_NAME>_bench is used and dropped afterwards.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+RESULTS_DIR = Path(__file__).parent / "results"
+PASSWORD = "benchmark-password"
+PGP_KEY = "mock-public-key"
+
+
+def percentile(samples: List[float], p: float) -> float:
+    """Nearest-rank percentile of already sorted samples"""
+    if not samples:
+        return 0.0
+    rank = max(1, round(p / 100 * len(samples)))
+    return samples[min(rank, len(samples)) - 1]
+
+
+class Recorder:
+    """Per-step latency samples (seconds) and error counts"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def timed(self, step: str, coro):
+        started = time.perf_counter()
+        try:
+            result = await coro
+        except Exception:
+            self.errors[step] += 1
+            raise
+        self.samples[step].append(time.perf_counter() - started)
+        return result
+
+    def summary(self, wall_seconds: float) -> dict:
+        steps = {}
+        for step in list(self.samples) + [s for s in self.errors if s not in self.samples]:
+            samples = sorted(self.samples.get(step, []))
+            steps[step] = {
+                "count": len(samples),
+                "errors": self.errors.get(step, 0),
+                "throughput_per_s": round(len(samples) / wall_seconds, 2),
+                "p50_ms": round(percentile(samples, 50) * 1000, 2),
+                "p95_ms": round(percentile(samples, 95) * 1000, 2),
+                "p99_ms": round(percentile(samples, 99) * 1000, 2),
+                "max_ms": round(samples[-1] * 1000, 2) if samples else 0.0,
+            }
+        return steps
+
+
+def _check(response: httpx.Response) -> dict:
+    if response.status_code >= 400:
+        raise RuntimeError(f"{response.request.url.path}: {response.status_code} {response.text}")
+    return response.json()
+
+
+class Client:
+    """One simulated user"""
+
+    def __init__(self, http: httpx.AsyncClient, username: str):
+        self.http = http
+        self.username = username
+        self.headers: Dict[str, str] = {}
+
+    async def register(self):
+        _check(await self.http.post("/auth/register", json={
+            "username": self.username,
+            "email": f"{self.username}@bench.invalid",
+            "birthday": "01/01/2000",
+            "password": PASSWORD,
+            "pgp_public_key": PGP_KEY,
+        }))
+
+    async def login(self):
+        body = _check(await self.http.post(
+            "/auth/login", json={"username": self.username, "password": PASSWORD}
+        ))
+        self.headers = {"Authorization": f"Bearer {body['access_token']}"}
+
+    async def request_connection(self, to_user: str) -> str:
+        body = _check(await self.http.post(
+            "/connections/request", headers=self.headers, json={"to_user": to_user}
+        ))
+        return body["request_id"]
+
+    async def accept(self, request_id: str):
+        _check(await self.http.post(
+            "/connections/respond",
+            headers=self.headers,
+            json={"request_id": request_id, "action": "accept"},
+        ))
+
+    async def send(self, to_user: str, signal_type: str, payload: str):
+        _check(await self.http.post("/signaling/send", headers=self.headers, json={
+            "to_user": to_user, "type": signal_type, "encrypted_payload": payload,
+        }))
+
+    async def receive(self, signal_type: str, count: int, timeout: float) -> List[dict]:
+        """Long-poll until `count` signals of a type arrived"""
+        received = []
+        deadline = time.perf_counter() + timeout
+        while len(received) < count:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError(f"{self.username}: {len(received)}/{count} {signal_type}")
+            body = _check(await self.http.get(
+                "/signaling/poll",
+                headers=self.headers,
+                params={"wait": max(1, min(int(remaining), 25))},
+            ))
+            received.extend(m for m in body["messages"] if m["type"] == signal_type)
+        return received
+
+
+async def run_pair(http: httpx.AsyncClient, recorder: Recorder, run_id: str, index: int,
+                   ice_candidates: int, timeout: float):
+    caller = Client(http, f"@b{run_id}_{index}_a")
+    callee = Client(http, f"@b{run_id}_{index}_b")
+
+    for client in (caller, callee):
+        await recorder.timed("register", client.register())
+    for client in (caller, callee):
+        await recorder.timed("login", client.login())
+
+    request_id = await recorder.timed(
+        "connection_request", caller.request_connection(callee.username)
+    )
+    await recorder.timed("connection_accept", callee.accept(request_id))
+
+    started = time.perf_counter()
+    await recorder.timed("send_offer", caller.send(callee.username, "offer", "sdp-offer"))
+    await recorder.timed("receive_offer", callee.receive("offer", 1, timeout))
+    await recorder.timed("send_answer", callee.send(caller.username, "answer", "sdp-answer"))
+    await recorder.timed("receive_answer", caller.receive("answer", 1, timeout))
+
+    # Trickle ICE: both sides send, both sides collect the other's
+    async def trickle(sender: Client, receiver: Client):
+        for i in range(ice_candidates):
+            await recorder.timed("send_ice", sender.send(receiver.username, "ice", f"cand-{i}"))
+
+    await asyncio.gather(
+        trickle(caller, callee),
+        trickle(callee, caller),
+        recorder.timed("receive_ice", caller.receive("ice", ice_candidates, timeout)),
+        recorder.timed("receive_ice", callee.receive("ice", ice_candidates, timeout)),
+    )
+    recorder.samples["handshake"].append(time.perf_counter() - started)
+
+
+async def run(args) -> dict:
+    # Imported late so --signal-store / --in-memory apply before settings load
+    if args.signal_store:
+        os.environ["SIGNAL_STORE"] = args.signal_store
+    if args.in_memory:
+        try:
+            import mongomock_motor
+        except ImportError:
+            sys.exit("--in-memory needs mongomock-motor (pip install mongomock-motor)")
+        import app.db.mongodb as mongodb
+        mongodb.AsyncIOMotorClient = mongomock_motor.AsyncMongoMockClient
+
+    from app.config import settings
+    from app.db.mongodb import db
+    from app.main import app, lifespan
+
+    settings.DATABASE_NAME = f"{settings.DATABASE_NAME}_bench"
+    # Every simulated client shares one address
+    settings.RATE_LIMIT_ENABLED = False
+
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+    limit = asyncio.Semaphore(args.concurrency)
+    failures = 0
+
+    async def one(index: int):
+        nonlocal failures
+        async with limit:
+            try:
+                await run_pair(http, recorder, run_id, index, args.ice, args.timeout)
+            except Exception as e:
+                failures += 1
+                if failures <= 5:
+                    print(f"pair {index} failed: {e}")
+
+    async with lifespan(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", timeout=args.timeout + 30
+        ) as http:
+            started = time.perf_counter()
+            await asyncio.gather(*(one(i) for i in range(args.pairs)))
+            wall = time.perf_counter() - started
+        if not args.in_memory:
+            await db.client.drop_database(settings.DATABASE_NAME)
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "config": {
+            "pairs": args.pairs,
+            "concurrency": args.concurrency,
+            "ice_candidates": args.ice,
+            "backend": "mongomock" if args.in_memory else "mongod",
+            "signal_store": settings.SIGNAL_STORE,
+            "signal_bus": settings.SIGNAL_BUS,
+        },
+        "wall_seconds": round(wall, 3),
+        "failed_pairs": failures,
+        "handshakes_per_s": round((args.pairs - failures) / wall, 2),
+        "steps": recorder.summary(wall),
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def print_report(result: dict, baseline: Optional[dict] = None):
+    config = result["config"]
+    print(
+        f"\n{config['pairs']} pairs, concurrency {config['concurrency']}, "
+        f"{config['ice_candidates']} ICE each, {config['backend']} "
+        f"(store={config['signal_store']}, bus={config['signal_bus']}) @ {result['commit']}"
+    )
+    print(
+        f"wall {result['wall_seconds']}s, {result['handshakes_per_s']} handshakes/s, "
+        f"{result['failed_pairs']} failed\n"
+    )
+    header = f"{'step':<20}{'count':>8}{'err':>6}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}"
+    header += f"{'p99 ms':>10}"
+    if baseline:
+        header += f"{'p95 vs base':>14}"
+    print(header)
+    for step, s in result["steps"].items():
+        line = (
+            f"{step:<20}{s['count']:>8}{s['errors']:>6}{s['throughput_per_s']:>10}"
+            f"{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}"
+        )
+        base = (baseline or {}).get("steps", {}).get(step)
+        if base and base["p95_ms"]:
+            line += f"{(s['p95_ms'] / base['p95_ms'] - 1) * 100:>+13.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end handshake benchmark")
+    parser.add_argument("--pairs", type=int, default=100, help="Client pairs to simulate")
+    parser.add_argument("--concurrency", type=int, default=20, help="Pairs in flight at once")
+    parser.add_argument("--ice", type=int, default=8, help="ICE candidates sent by each side")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-receive timeout (s)")
+    parser.add_argument("--in-memory", action="store_true", help="Use mongomock-motor")
+    parser.add_argument("--signal-store", choices=["mongo", "memory"], help="Override SIGNAL_STORE")
+    parser.add_argument("--out", type=Path, help="Result file (default: results/<commit>-<time>)")
+    parser.add_argument("--compare", type=Path, help="Earlier result file to compare p95 against")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+
+    out = args.out or RESULTS_DIR / (
+        f"{result['commit']}-{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.json"
+    )
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2))
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    print_report(result, baseline)
+    print(f"\nSaved {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Email outbox end to end: deliver_batch against an in-process SMTP
+server (aiosmtpd) with the outbox collection in mongomock - sending,
+retry with backoff, permanent failures, connection reuse and lease
+renewal during a slow batch.
+"""
+
+import asyncio
+import socket
+from datetime import datetime
+import pytest
+from aiosmtpd.controller import Controller
+from mongomock_motor import AsyncMongoMockClient
+from app.config import settings
+from app.db import mongodb
+from app.services.email_outbox import EmailOutbox
+
+
+class _Server:
+    """aiosmtpd handler - records deliveries, refuses chosen recipients"""
+
+    def __init__(self):
+        self.delivered = []  # (recipient, client address)
+        self.refuse = {}  # recipient -> SMTP reply
+        self.delay = 0.0
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.refuse:
+            return self.refuse[address]
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.delay)
+        for recipient in envelope.rcpt_tos:
+            self.delivered.append((recipient, session.peer))
+        return "250 Message accepted"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+async def database(monkeypatch):
+    monkeypatch.setattr(mongodb, "AsyncIOMotorClient", lambda *a, **k: AsyncMongoMockClient())
+    await mongodb.connect_db("outbox_test")
+    yield mongodb.get_database()
+    await mongodb.close_db()
+
+
+@pytest.fixture
+def server(monkeypatch):
+    server = _Server()
+    controller = Controller(server, hostname="127.0.0.1", port=_free_port())
+    controller.start()
+    monkeypatch.setattr(settings, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(settings, "SMTP_PORT", controller.port)
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(settings, "SMTP_SSL", False)
+    monkeypatch.setattr(settings, "SMTP_USERNAME", "")
+    monkeypatch.setattr(settings, "SMTP_TIMEOUT_SECONDS", 5)
+    yield server
+    controller.stop()
+
+
+@pytest.fixture
+async def outbox(database, server):
+    outbox = _make_outbox()
+    yield outbox
+    await outbox.stop()
+
+
+def _make_outbox(**overrides) -> EmailOutbox:
+    options = {
+        "workers": 1,
+        "batch_size": 10,
+        "poll_seconds": 1,
+        "lease_seconds": 60,
+        "max_attempts": 3,
+        "retry_base_seconds": 10,
+        "retry_max_seconds": 60,
+    }
+    options.update(overrides)
+    return EmailOutbox(**options)
+
+
+async def _enqueue(outbox: EmailOutbox, *recipients: str):
+    for recipient in recipients:
+        await outbox.enqueue(recipient, "Your code", "123456")
+
+
+async def test_sends_and_reuses_the_connection(outbox, server, database):
+    await _enqueue(outbox, "a@test.invalid", "b@test.invalid", "c@test.invalid")
+    assert await outbox.deliver_batch() == 3
+    await _enqueue(outbox, "d@test.invalid")
+    assert await outbox.deliver_batch() == 1
+
+    recipients = [recipient for recipient, _ in server.delivered]
+    assert recipients == ["a@test.invalid", "b@test.invalid", "c@test.invalid", "d@test.invalid"]
+    assert len({peer for _, peer in server.delivered}) == 1
+    assert await database.email_outbox.count_documents({}) == 0
+    stats = outbox.stats()
+    assert stats["sent"] == 4
+    assert stats["connections_opened"] == 1
+    assert stats["connections_reused"] == 1
+
+
+async def test_transient_failure_is_retried_with_backoff(outbox, server, database):
+    server.refuse["a@test.invalid"] = "451 4.3.0 Try again later"
+    await _enqueue(outbox, "a@test.invalid")
+    before = datetime.utcnow()
+    assert await outbox.deliver_batch() == 1
+
+    job = await database.email_outbox.find_one({})
+    assert job["status"] == "pending"
+    assert job["attempts"] == 1
+    assert "451" in job["last_error"]
+    assert "lease_until" not in job
+    # First retry: retry_base_seconds, jittered down to half
+    delay = (job["next_attempt_at"] - before).total_seconds()
+    assert 5 - 1 <= delay <= 10 + 1
+    assert await outbox.deliver_batch() == 0  # not due yet
+
+    del server.refuse["a@test.invalid"]
+    await database.email_outbox.update_one(
+        {"_id": job["_id"]}, {"$set": {"next_attempt_at": datetime.utcnow()}}
+    )
+    assert await outbox.deliver_batch() == 1
+    assert [recipient for recipient, _ in server.delivered] == ["a@test.invalid"]
+    assert await database.email_outbox.count_documents({}) == 0
+    assert outbox.stats()["retried"] == 1
+    assert outbox.stats()["sent"] == 1
+
+
+async def test_permanent_failure_is_not_retried(outbox, server, database):
+    server.refuse["gone@test.invalid"] = "550 5.1.1 No such user"
+    await _enqueue(outbox, "gone@test.invalid", "ok@test.invalid")
+    assert await outbox.deliver_batch() == 2
+
+    job = await database.email_outbox.find_one({})
+    assert job["status"] == "failed"
+    assert job["attempts"] == 1
+    assert "550" in job["last_error"]
+    assert [recipient for recipient, _ in server.delivered] == ["ok@test.invalid"]
+    assert await outbox.deliver_batch() == 0
+    assert outbox.stats()["failed"] == 1
+
+
+async def test_lease_is_renewed_while_a_batch_is_sent(database, server):
+    outbox = _make_outbox(lease_seconds=1)
+    other_worker = _make_outbox(lease_seconds=1)
+    server.delay = 2
+    await _enqueue(outbox, "slow@test.invalid")
+    try:
+        delivery = asyncio.create_task(outbox.deliver_batch())
+        await asyncio.sleep(1.5)  # past the original lease
+        jobs, _ = await other_worker._claim()
+        assert jobs == []
+        assert await delivery == 1
+        assert len(server.delivered) == 1
+    finally:
+        await outbox.stop()
+        await other_worker.stop()
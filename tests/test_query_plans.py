@@ -0,0 +1,172 @@
+"""
+Query plan check: runs the service functions against a scratch database
+on a local mongod, records every query they send and asserts from
+explain() that none of them scans a whole collection.
+Skipped when no mongod answers at MONGODB_URL.
+"""
+
+import socket
+import pytest
+from pymongo.errors import ServerSelectionTimeoutError
+from app.config import settings
+from app.db import mongodb
+from app.db.query_plans import QueryRecorder, check_query_plans
+from app.schemas.auth import RegisterRequest
+from app.schemas.signaling import SignalSendRequest
+from app.services import (
+    auth_service,
+    connection_service,
+    handshake_service,
+    signaling_service,
+)
+from app.services.connection_graph import connection_graph
+from app.services.email_outbox import email_outbox
+from app.services.presence_service import presence
+from app.services.signal_store import MongoSignalStore
+from app.utils.password_pool import password_pool
+
+PASSWORD = "plan-check-password"
+USERS = ["@plan_alice", "@plan_bob", "@plan_carol"]
+
+
+def _closed_port() -> int:
+    """A local port nothing listens on - SMTP delivery fails and is retried"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+async def recorder(monkeypatch):
+    database_name = f"{settings.DATABASE_NAME}_plancheck"
+    recorder = QueryRecorder(database_name)
+    monkeypatch.setattr(settings, "MONGO_SERVER_SELECTION_TIMEOUT_MS", 2000)
+    try:
+        await mongodb.connect_db(database_name, [recorder])
+    except ServerSelectionTimeoutError:
+        await mongodb.close_db()
+        pytest.skip(f"no mongod at {settings.MONGODB_URL}")
+
+    # The Mongo store's queries are the ones to check, whatever SIGNAL_STORE says
+    store = MongoSignalStore()
+    monkeypatch.setattr(signaling_service, "signal_store", store)
+    monkeypatch.setattr(handshake_service, "signal_store", store)
+    # Small batches, so polls are cut and look up offers queued past them
+    monkeypatch.setattr(settings, "SIGNAL_POLL_BATCH_SIZE", 2)
+    monkeypatch.setattr(settings, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(settings, "SMTP_PORT", _closed_port())
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(settings, "SMTP_TIMEOUT_SECONDS", 1)
+    try:
+        yield recorder
+    finally:
+        password_pool.stop()
+        await mongodb.db.client.drop_database(database_name)
+        await mongodb.close_db()
+
+
+async def _exercise_auth():
+    alice, bob, carol = USERS
+    for username in USERS:
+        await auth_service.register_user(
+            RegisterRequest(
+                username=username,
+                email=f"{username[1:]}@plan.invalid",
+                birthday="01/01/2000",
+                password=PASSWORD,
+                pgp_public_key="mock-public-key",
+            )
+        )
+    with pytest.raises(ValueError):
+        await auth_service.register_user(
+            RegisterRequest(
+                username=alice,
+                email="other@plan.invalid",
+                birthday="01/01/2000",
+                password=PASSWORD,
+                pgp_public_key="mock-public-key",
+            )
+        )
+    await auth_service.login_user(alice, PASSWORD)
+    await auth_service.login_user("plan_bob@plan.invalid", PASSWORD)
+    await auth_service.get_user_public(bob)
+    await auth_service.get_users_public_batch([alice, bob, "@plan_nobody"])
+    first = await auth_service.search_users("@plan", limit=1)
+    await auth_service.search_users("@plan", limit=1, after=first[-1]["username"])
+    await auth_service.update_pgp_key(carol, "mock-public-key-2")
+    await auth_service.set_user_offline(carol)
+    await auth_service.request_password_reset(carol)
+    with pytest.raises(ValueError):
+        await auth_service.reset_password(carol, "000000x", "new-password-1")
+
+
+async def _exercise_connections():
+    alice, bob, carol = USERS
+    await connection_service.send_connection_request(alice, bob)
+    await connection_service.send_connection_request(carol, bob)
+    with pytest.raises(ValueError):
+        await connection_service.send_connection_request(bob, alice)
+
+    pending, cursor = await connection_service.get_pending_requests(bob, limit=1)
+    more, _ = await connection_service.get_pending_requests(bob, limit=1, after=cursor)
+    for request in pending + more:
+        await connection_service.respond_to_request(request["request_id"], "accept", bob)
+
+    _, cursor = await connection_service.get_connections(bob, limit=1)
+    await connection_service.get_connections(bob, limit=1, after=cursor)
+
+    connection_graph.invalidate(alice)
+    await connection_graph.are_connected(alice, bob)
+    await connection_service.remove_connection(carol, bob)
+
+
+async def _exercise_signaling():
+    alice, bob, _ = USERS
+
+    def signal(signal_type: str, **extra) -> SignalSendRequest:
+        return SignalSendRequest(
+            to_user=bob, type=signal_type, encrypted_payload="blob", **extra
+        )
+
+    generation = await signaling_service.send_signal(alice, signal("offer"))
+    await signaling_service.send_signals(
+        alice, [signal("ice", generation=generation) for _ in range(3)]
+    )
+    await signaling_service.poll_signals(bob)
+
+    await signaling_service.send_signal(alice, signal("offer"))
+    leased = await signaling_service.poll_signals(bob, lease=True, coalesce=True)
+    await signaling_service.poll_signals(bob, ack=leased.cursor)
+
+    session = await handshake_service.create_session(alice, bob)
+    await handshake_service.get_session(bob, session.session_id)
+    await signaling_service.send_signal(alice, signal("offer", session_id=session.session_id))
+    await signaling_service.send_signal(
+        alice, signal("ice", session_id=session.session_id, generation=generation)
+    )
+    await signaling_service.poll_signals(bob, session_id=session.session_id, lease=True)
+    await handshake_service.finish_session(bob, session.session_id, "connected")
+
+    await signaling_service.send_signal(alice, signal("ice", generation=generation))
+    await signaling_service.clear_signals(bob)
+
+
+async def _exercise_background():
+    alice, bob, _ = USERS
+    presence.heartbeat(alice)
+    presence.set_offline(bob)
+    await presence.flush()
+    await presence.online_status(["@plan_nobody"])
+    # The reset mail from _exercise_auth: claimed, fails to send, rescheduled
+    await email_outbox.deliver_batch()
+
+
+async def test_service_queries_are_index_backed(recorder):
+    await _exercise_auth()
+    await _exercise_connections()
+    await _exercise_signaling()
+    await _exercise_background()
+
+    assert recorder.queries, "no queries recorded"
+    failures = await check_query_plans(mongodb.get_database(), recorder.queries)
+    assert not failures, "\n".join(failures)
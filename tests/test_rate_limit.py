@@ -0,0 +1,82 @@
+"""
+RateLimiter: bucket eviction, per-shard overflow and IPv6 client keys
+"""
+
+import pytest
+from app.config import settings
+from app.utils import rate_limit
+from app.utils.rate_limit import RateLimiter, ip_key
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def _keys_in_shard(limiter: RateLimiter, shard: int, count: int):
+    keys = (f"key-{i}" for i in range(10000))
+    return [key for key in keys if hash(key) % len(limiter._shards) == shard][:count]
+
+
+def test_idle_buckets_are_evicted(clock):
+    limiter = RateLimiter(rate=1, burst=2, shards=1, idle_seconds=60, max_keys=10)
+    limiter.hit("a")
+    limiter.hit("b")
+    clock.now += 30
+    limiter.hit("b")
+    clock.now += 30  # a idle for 60 s, b for 30 s
+    limiter.hit("c")
+    assert list(limiter._shards[0]) == ["b", "c"]
+
+
+def test_active_buckets_are_never_evicted(clock):
+    limiter = RateLimiter(rate=1, burst=2, shards=1, idle_seconds=60, max_keys=2)
+    assert limiter.hit("a", 2) == 0
+    limiter.hit("b")
+    clock.now += 1  # a is still short of tokens
+    assert limiter.hit("c") == 0
+    assert list(limiter._shards[0]) == ["a", "b"]
+    assert limiter.overflowed == 1
+    # a's limit survives the newcomer
+    assert limiter.hit("a", 2) > 0
+
+
+def test_refilled_buckets_make_room_over_the_cap(clock):
+    limiter = RateLimiter(rate=1, burst=2, shards=1, idle_seconds=60, max_keys=2)
+    limiter.hit("a")
+    limiter.hit("b")
+    clock.now += 2  # both full again, though not idle
+    limiter.hit("c")
+    assert list(limiter._shards[0]) == ["b", "c"]
+    assert limiter.overflowed == 0
+
+
+def test_overflow_is_per_shard(clock):
+    limiter = RateLimiter(rate=1, burst=2, shards=2, idle_seconds=60, max_keys=2)
+    flooded = _keys_in_shard(limiter, 0, 10)
+    for key in flooded:
+        limiter.hit(key, 2)
+    # The flood's overflow bucket is drained...
+    assert limiter.hit(flooded[-1]) > 0
+    # ...but a new client of the other shard gets its own bucket
+    other = _keys_in_shard(limiter, 1, 1)[0]
+    assert limiter.hit(other) == 0
+
+
+def test_ipv6_clients_are_keyed_by_prefix(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_IPV6_PREFIX", 64)
+    assert ip_key("2001:db8:1:2::1") == ip_key("2001:db8:1:2:ffff::9") == "2001:db8:1:2::/64"
+    assert ip_key("2001:db8:1:3::1") != ip_key("2001:db8:1:2::1")
+    assert ip_key("::ffff:192.0.2.7") == "192.0.2.7"
+    assert ip_key("192.0.2.7") == "192.0.2.7"
+    assert ip_key("unknown") == "unknown"
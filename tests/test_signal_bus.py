@@ -0,0 +1,31 @@
+"""
+Signal bus backends: signaling_service.start subscribes each of them
+with both handlers, and invalidation events reach the connection graph.
+"""
+
+import asyncio
+import pytest
+from app.config import settings
+from app.services import signaling_service
+from app.services.connection_graph import connection_graph
+from app.services.signal_bus import create_signal_bus
+
+
+@pytest.mark.parametrize("backend", ["memory", "mongo"])
+async def test_signaling_starts_on_each_bus(backend, monkeypatch):
+    bus = create_signal_bus(backend)
+    if backend == "mongo":
+        # No replica set to watch here - the subscription is what's under test
+        monkeypatch.setattr(bus, "_watch", asyncio.Event().wait)
+        monkeypatch.setattr(settings, "SIGNAL_STORE", "mongo")
+    monkeypatch.setattr(signaling_service, "signal_bus", bus)
+    invalidated = []
+    monkeypatch.setattr(connection_graph, "invalidate", lambda *users: invalidated.extend(users))
+
+    await signaling_service.start()
+    try:
+        # What the change stream (or the in-process publish) hands over
+        bus._dispatch_invalidation(["@alice", "@bob"])
+        assert invalidated == ["@alice", "@bob"]
+    finally:
+        await signaling_service.stop()